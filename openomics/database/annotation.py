@@ -5,7 +5,7 @@ from os.path import expanduser
 from bioservices import BioMart
 
 from openomics.database.base import Database
-from openomics.utils.df import concat_uniques
+from openomics.utils.df import groupby_concat_uniques
 from openomics.utils.io import mkdirs
 
 DEFAULT_CACHE_PATH = os.path.join(expanduser("~"), ".openomics")
@@ -14,6 +14,11 @@ DEFAULT_LIBRARY_PATH = os.path.join(expanduser("~"), ".openomics", "databases")
 import pandas as pd
 import dask.dataframe as dd
 
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
 class TANRIC(Database):
     def __init__(self, path, file_resources=None, col_rename=None, npartitions=0, verbose=False):
         """
@@ -45,7 +50,7 @@ class TANRIC(Database):
             genes_index:
         """
         df = pd.read_table(self.file_resources["TCGA-LUAD-rnaexpr.tsv"])
-        df[genes_index] = df[genes_index].str.replace("[.].*", "")  # Removing .# ENGS gene version number at the end
+        df[genes_index] = df[genes_index].str.split(".", n=1).str[0]  # Removing .# ENGS gene version number at the end
         df = df[~df[genes_index].duplicated(keep='first')]  # Remove duplicate genes
 
         # Drop NA gene rows
@@ -181,18 +186,24 @@ class RNAcentral(Database):
                                  low_memory=True, header=None, names=["RNAcentral id", "GO terms", "Rfams"])
         go_terms["RNAcentral id"] = go_terms["RNAcentral id"].str.split("_", expand=True, n=2)[0]
 
+        # Low-cardinality columns are parsed as categoricals to avoid storing repeated strings as objects, and the
+        # NCBI taxon ids as integers so that the species filter is a vectorized comparison
+        id_mapping_dtypes = {"database": "category", "species": "int32", "RNA type": "category"}
+
         gene_ids = []
         for file in file_resources:
             if "database_mappings" in file:
                 if npartitions:
                     id_mapping = dd.read_table(file_resources[file], header=None,
                                                names=["RNAcentral id", "database", "external id", "species", "RNA type",
-                                                      "gene symbol"])
+                                                      "gene symbol"],
+                                               dtype=id_mapping_dtypes)
                 else:
                     id_mapping = pd.read_table(file_resources[file],
                                                low_memory=True, header=None,
                                                names=["RNAcentral id", "database", "external id", "species", "RNA type",
-                                                      "gene symbol"])
+                                                      "gene symbol"],
+                                               dtype=id_mapping_dtypes)
 
                 gene_ids.append(id_mapping)
 
@@ -201,17 +212,21 @@ class RNAcentral(Database):
         else:
             gene_ids = pd.concat(gene_ids, join="inner")
 
-        gene_ids["species"] = gene_ids["species"].astype("O")
         if self.species is not None:
-            gene_ids = gene_ids[gene_ids["species"] == self.species]
+            gene_ids = gene_ids[gene_ids["species"] == int(self.species)]
 
-        lnc_go_terms = go_terms[go_terms["RNAcentral id"].isin(gene_ids["RNAcentral id"])].groupby("RNAcentral id")[
-            "GO terms"].apply(lambda x: "|".join(x.unique()))
-        lnc_rfams = go_terms[go_terms["RNAcentral id"].isin(gene_ids["RNAcentral id"])].groupby("RNAcentral id")[
-            "Rfams"].apply(lambda x: "|".join(x.unique()))
+        # Build the hash set of the selected RNA ids once
+        rna_ids = gene_ids["RNAcentral id"].unique()
+        if isinstance(rna_ids, dd.Series):
+            rna_ids = rna_ids.compute()
+        rna_ids = pd.Index(rna_ids)
 
-        gene_ids["GO terms"] = gene_ids["RNAcentral id"].map(lnc_go_terms)
-        gene_ids["Rfams"] = gene_ids["RNAcentral id"].map(lnc_rfams)
+        # Concatenate the unique GO terms and Rfams of each RNA id, then join them to the RNA ids
+        go_terms = go_terms[go_terms["RNAcentral id"].isin(rna_ids)]
+        rna_annotations = pd.DataFrame({col: groupby_concat_uniques(go_terms["RNAcentral id"], go_terms[col]) \
+                                        for col in ["GO terms", "Rfams"]})
+
+        gene_ids = gene_ids.join(rna_annotations, on="RNAcentral id")
         gene_ids = gene_ids[gene_ids["GO terms"].notnull() | gene_ids["Rfams"].notnull()]
 
         return gene_ids
@@ -263,7 +278,7 @@ class GTEx(Database):
         gene_exp_medians = pd.read_csv(
             self.file_resources["GTEx_Analysis_2017-06-05_v8_RNASeQCv1.1.9_gene_median_tpm.gct"],
             sep='\t', header=1, skiprows=1)
-        gene_exp_medians["Name"] = gene_exp_medians["Name"].str.replace("[.].*", "", regex=True)
+        gene_exp_medians["Name"] = gene_exp_medians["Name"].str.split(".", n=1).str[0]
         gene_exp_medians = gene_exp_medians.rename(columns=self.COLUMNS_RENAME_DICT)  # Must be done here
         gene_exp_medians.set_index(["gene_id", "gene_name"], inplace=True)
 
@@ -346,17 +361,19 @@ class NONCODE(Database):
         self.noncode_func_df.columns = ["NONCODE Gene ID", "GO terms"]
         self.noncode_func_df.set_index("NONCODE Gene ID", inplace=True)
 
-        # Convert to NONCODE transcript ID for the functional annotation data
-        self.noncode_func_df["NONCODE Transcript ID"] = self.noncode_func_df.index.map(
-            pd.Series(transcript2gene_df['NONCODE Transcript ID'].values,
-                      index=transcript2gene_df['NONCODE Gene ID']).to_dict())
+        # Convert to NONCODE transcript ID for the functional annotation data. The lookup Series are mapped directly
+        # instead of through a dict, keeping the last of any duplicated keys as a dict would.
+        gene2transcript = pd.Series(transcript2gene_df['NONCODE Transcript ID'].values,
+                                    index=transcript2gene_df['NONCODE Gene ID'])
+        gene2transcript = gene2transcript[~gene2transcript.index.duplicated(keep="last")]
+        self.noncode_func_df["NONCODE Transcript ID"] = self.noncode_func_df.index.map(gene2transcript)
 
         # Convert NONCODE transcript ID to gene names
-        source_gene_names_df = source_df[source_df["name type"] == "NAME"].copy()
-
-        self.noncode_func_df["Gene Name"] = self.noncode_func_df["NONCODE Transcript ID"].map(
-            pd.Series(source_gene_names_df['Gene ID'].values,
-                      index=source_gene_names_df['NONCODE Transcript ID']).to_dict())
+        source_gene_names_df = source_df[source_df["name type"] == "NAME"]
+        transcript2name = pd.Series(source_gene_names_df['Gene ID'].values,
+                                    index=source_gene_names_df['NONCODE Transcript ID'])
+        transcript2name = transcript2name[~transcript2name.index.duplicated(keep="last")]
+        self.noncode_func_df["Gene Name"] = self.noncode_func_df["NONCODE Transcript ID"].map(transcript2name)
 
 
 class BioMartManager:
@@ -383,8 +400,16 @@ class BioMartManager:
             filename:
             npartitions:
         """
+        parquet_filename = os.path.join(DEFAULT_CACHE_PATH, "{}.parquet".format(filename))
         filename = os.path.join(DEFAULT_CACHE_PATH, "{}.tsv".format(filename))
-        if os.path.exists(filename):
+
+        # Prefer the typed parquet cache, and fall back to a TSV cache from older versions
+        if pa is not None and os.path.exists(parquet_filename):
+            if npartitions:
+                df = dd.read_parquet(parquet_filename)
+            else:
+                df = pd.read_parquet(parquet_filename)
+        elif os.path.exists(filename):
             if npartitions:
                 df = dd.read_csv(filename, sep="\t")
             else:
@@ -395,11 +420,14 @@ class BioMartManager:
         return df
 
     def cache_dataset(self, dataset, dataframe, save_filename):
-        """
+        """Saves the queried dataframe as a parquet file if pyarrow is
+        installed, otherwise as a TSV file.
+
         Args:
             dataset:
             dataframe:
-            save_filename:
+            save_filename: The path of the TSV file. The parquet file is saved
+                next to it with the ".parquet" extension instead.
         """
         if not os.path.exists(DEFAULT_CACHE_PATH):
             mkdirs(DEFAULT_CACHE_PATH)
@@ -407,7 +435,11 @@ class BioMartManager:
         if save_filename is None:
             save_filename = os.path.join(DEFAULT_CACHE_PATH, "{}.tsv".format(dataset))
 
-        dataframe.to_csv(save_filename, sep="\t", index=False)
+        if pa is not None:
+            save_filename = os.path.splitext(save_filename)[0] + ".parquet"
+            dataframe.to_parquet(save_filename, compression="zstd")
+        else:
+            dataframe.to_csv(save_filename, sep="\t", index=False)
         return save_filename
 
     def query_biomart(self, dataset, attributes, host="www.ensembl.org", cache=True, save_filename=None,
@@ -488,9 +520,16 @@ class EnsemblGenes(BioMartManager, Database):
             from_index:
             to_index:
         """
-        geneid_to_genename = self.data[self.data[to_index].notnull()] \
-            .groupby(from_index)[to_index] \
-            .apply(concat_uniques).to_dict()
+        mapping = self.data.loc[self.data[from_index].notnull() & self.data[to_index].notnull(), [from_index, to_index]]
+        if isinstance(mapping, dd.DataFrame):
+            mapping = mapping.compute()
+
+        # When each key maps to a single value, which is the common case, skip concatenating the unique values
+        if mapping.groupby(from_index, sort=False)[to_index].nunique().max() == 1:
+            mapping = mapping.drop_duplicates(from_index)
+            return dict(zip(mapping[from_index], mapping[to_index].astype(str)))
+
+        geneid_to_genename = groupby_concat_uniques(mapping[from_index], mapping[to_index]).to_dict()
         return geneid_to_genename
 
     def get_functional_annotations(self, index):
@@ -498,9 +537,11 @@ class EnsemblGenes(BioMartManager, Database):
         Args:
             index:
         """
-        geneid_to_go = self.data[self.data["go_id"].notnull()] \
-            .groupby(index)["go_id"] \
-            .apply(lambda x: "|".join(x.unique())).to_dict()
+        mapping = self.data[[index, "go_id"]]
+        if isinstance(mapping, dd.DataFrame):
+            mapping = mapping.compute()
+
+        geneid_to_go = groupby_concat_uniques(mapping[index], mapping["go_id"]).dropna().to_dict()
         return geneid_to_go
 
 
@@ -1,7 +1,6 @@
 from typing import Dict, Tuple, List
 import copy
 import difflib
-import gzip
 import itertools
 import logging
 import os
@@ -11,12 +10,19 @@ from typing import List
 
 import dask.dataframe as dd
 import filetype
+import numpy as np
 import pandas as pd
 import rarfile
 import validators
 
-from openomics.utils.df import concat_uniques
-from openomics.utils.io import get_pkg_data_filename
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    process = None
+
+from openomics.utils.df import groupby_concat_uniques, to_arrow_strings
+from openomics.utils.groupby import NUMBA_AGGREGATIONS, groupby_aggregate, njit
+from openomics.utils.io import archive_member_path, extract_zip_member, get_pkg_data_filename, open_gzip
 
 
 class Database(object):
@@ -30,6 +36,8 @@ class Database(object):
     """
 
     COLUMNS_RENAME_DICT = None  # Needs initialization since subclasses may use this field to rename columns in dataframes.
+    # Whether `load_dataframe()` accepts a `columns` argument, and can be called again without consuming the resources
+    LOADS_COLUMN_SUBSETS = False
 
     def __init__(
         self,
@@ -57,20 +65,62 @@ class Database(object):
         """
         self.npartitions = npartitions
         self.verbose = verbose
+        self.col_rename = col_rename
+        self._annotations_cache = {}
 
         self.validate_file_resources(path,
                                      file_resources,
                                      npartitions=npartitions,
                                      verbose=verbose)
 
-        self.data = self.load_dataframe(file_resources,
-                                        npartitions=npartitions)
-        self.data = self.data.reset_index()
-        if col_rename is not None:
-            self.data = self.data.rename(columns=col_rename)
-
+        # self.data is loaded from the file resources on first access
         self.info() if verbose else None
 
+    def read_data(self, columns=None):
+        """Loads the DataFrame with `load_dataframe()` from the file resources,
+        then renames its columns with `col_rename`.
+
+        Args:
+            columns (list): default None. If given and the subclass sets
+                `LOADS_COLUMN_SUBSETS`, only these (renamed) columns are loaded.
+
+        Returns:
+            data: A pandas or dask DataFrame.
+        """
+        if columns is not None and self.LOADS_COLUMN_SUBSETS:
+            # Map the requested column names back to the column names in the file resources
+            raw_names = {new: old for old, new in self.col_rename.items()} if self.col_rename else {}
+            data = self.load_dataframe(self.file_resources, npartitions=self.npartitions,
+                                       columns=[raw_names.get(col, col) for col in columns])
+        else:
+            data = self.load_dataframe(self.file_resources, npartitions=self.npartitions)
+        data = data.reset_index()
+        if self.col_rename is not None:
+            data = data.rename(columns=self.col_rename)
+        return to_arrow_strings(data)
+
+    @property
+    def data(self):
+        """The Database's DataFrame, which is lazily loaded with `read_data()`
+        on first access, so that e.g. only fetching sequences doesn't parse the
+        tabular file resources.
+        """
+        if getattr(self, "_data", None) is None:
+            self.data = self.read_data()
+        return self._data
+
+    @data.setter
+    def data(self, dataframe):
+        """Assigning a new DataFrame invalidates the cached results of
+        `get_annotations()`. Modifying `self.data` in-place is not tracked, so the
+        DataFrame should be treated as immutable once assigned.
+
+        Args:
+            dataframe: A pandas or dask DataFrame.
+        """
+        self._data = dataframe
+        self._annotations_cache = {}
+
     def info(self):
         logging.info("{}: {}".format(self.name(), self.data.columns.tolist()))
 
@@ -112,29 +162,17 @@ class Database(object):
 
                 elif filepath_ext.extension == "gz":
                     logging.debug("Decompressed gzip file at {}".format(data_file))
-                    file_resources[filename] = gzip.open(data_file, "rt")
+                    file_resources[filename] = open_gzip(data_file)
 
                 elif filepath_ext.extension == "zip":
-                    logging.debug("Decompressed zip file at {}".format(data_file))
-                    zf = zipfile.ZipFile(data_file, "r")
-
-                    for subfile in zf.infolist():
-                        if (os.path.splitext(subfile.filename)[-1] ==
-                                os.path.splitext(filename)[-1]
-                            ):  # If the file extension matches
-                            file_resources[filename] = zf.open(
-                                subfile.filename, mode="r")
+                    logging.debug("Extracted zip file at {}".format(data_file))
+                    with zipfile.ZipFile(data_file, "r") as zf:
+                        file_resources[filename] = extract_member(zf, filename, data_file)
 
                 elif filepath_ext.extension == "rar":
-                    logging.debug("Decompressed rar file at {}".format(data_file))
-                    rf = rarfile.RarFile(data_file, "r")
-
-                    for subfile in rf.infolist():
-                        if (os.path.splitext(subfile.filename)[-1] ==
-                                os.path.splitext(filename)[-1]
-                            ):  # If the file extension matches
-                            file_resources[filename] = rf.open(
-                                subfile.filename, mode="r")
+                    logging.debug("Extracted rar file at {}".format(data_file))
+                    with rarfile.RarFile(data_file, "r") as rf:
+                        file_resources[filename] = extract_member(rf, filename, data_file)
                 else:
                     file_resources[filename] = data_file
 
@@ -175,10 +213,14 @@ class Database(object):
     def list_databases():
         return DEFAULT_LIBRARIES
 
-    def get_annotations(self, index: str, columns: list, agg: str = "concat", filter_values: pd.Series = None):
+    def get_annotations(self, index: str, columns: list, agg: str = "concat", filter_values: pd.Series = None,
+                        as_list: bool = False):
         """Returns the Database's DataFrame such that it's indexed by :param
         index:, which then applies a groupby operation and aggregates all other
-        columns by concatenating all unique values.
+        columns by concatenating all unique values. Results on a pandas
+        DataFrame are cached before `filter_values` is applied, such that
+        repeated calls with the same index, columns and agg skip the groupby
+        operation until `self.data` is reassigned.
 
         Args:
             index (str): The column name of the DataFrame to join by.
@@ -188,56 +230,95 @@ class Database(object):
                 'size', 'concat'], default 'concat'.
             filter_values (pd.Series): The values on the `index` column to
                 filter before performing the groupby-agg operations.
+            as_list (bool): default False. If True and agg is "concat", the
+                unique values for each index are returned as lists instead of
+                "|"-joined strings. Only applies to pandas DataFrames.
 
         Returns:
             DataFrame: A dataframe to be used for annotation
         """
-        if not set(columns).issubset(set(self.data.columns)):
+        cache_key = (index, tuple(columns), agg, as_list)
+        if cache_key in self._annotations_cache:
+            aggregated = self._annotations_cache[cache_key]
+            if filter_values is not None:
+                aggregated = aggregated[aggregated.index.isin(list(filter_values))]
+            return aggregated.copy(deep=False)
+
+        # Before self.data is loaded, only parse the requested columns if the loader supports it
+        if getattr(self, "_data", None) is None and self.LOADS_COLUMN_SUBSETS:
+            data = self.read_data(columns=list(dict.fromkeys([index] + list(columns))))
+        else:
+            data = self.data
+
+        if not set(columns).issubset(set(data.columns)):
             raise Exception(
                 "The columns argument must be a list such that it's subset of the following columns in the dataframe",
-                "These columns doesn't exist in database:", set(columns) - set(self.data.columns.tolist())
+                "These columns doesn't exist in database:", set(columns) - set(data.columns.tolist())
             )
 
         # Select df columns including df. However the `columns` list shouldn't contain the index column
-        if index in columns:
-            columns.pop(columns.index(index))
+        columns = [col for col in columns if col != index]
 
-        df = self.data[columns + [index]]
+        # If the DataFrame is already indexed by `index`, group on the index level rather than re-hashing a column
+        if isinstance(data, pd.DataFrame) and index == data.index.name:
+            df = data.loc[:, columns]
+            keys = df.index
+            groupby = df.groupby(level=0, sort=False, observed=True)
 
-        if filter_values is not None:
-            df = df[df[index].isin(list(filter_values))]
+        else:
+            df = data[columns + [index]]
 
-        # if index != self.data.index.name and index in self.data.columns:
-        #     df = df.set_index(index)
+            # A pandas DataFrame is aggregated in whole to be cached, and filtered afterwards
+            if filter_values is not None and not isinstance(df, pd.DataFrame):
+                df = df[df[index].isin(list(filter_values))]
 
-        # Groupby index
-        groupby = df.groupby(index)
+            if isinstance(df, pd.DataFrame):
+                keys = df[index]
+                groupby = df.groupby(index, sort=False, observed=True)
+            else:
+                groupby = df.groupby(index)
 
         #  Aggregate by all columns by concatenating unique values
         if agg == "concat":
             if isinstance(df, pd.DataFrame):
-                aggregated = groupby.agg({col: concat_uniques for col in columns})
+                # Split each column's deduplicated values at the group boundaries, rather than aggregating each group
+                aggregated = pd.DataFrame({col: groupby_concat_uniques(keys, df[col], as_list=as_list)
+                                           for col in columns})
+                aggregated.index.name = index
 
             elif isinstance(df, dd.DataFrame):
+                # Deduplicate each group's values within each partition first, so that only the partial uniques
+                # rather than all rows are combined across partitions
                 collect_concat = dd.Aggregation(
                     name='collect_concat',
-                    chunk=lambda s1: s1.apply(list),
-                    agg=lambda s2: s2.apply(lambda chunks: filter(
-                        lambda x: False if x == "None" or x is None else True,
-                        set(itertools.chain.from_iterable(chunks)))),
-                    finalize=lambda s3: s3.apply(lambda xx: '|'.join(xx))
+                    chunk=lambda s1: s1.unique(),
+                    agg=lambda s2: s2.apply(lambda chunks: {
+                        x for x in itertools.chain.from_iterable(chunks) if pd.notnull(x) and x != "None"}),
+                    finalize=lambda s3: s3.apply(lambda xx: '|'.join(map(str, xx)) if xx else None)
                 )
                 aggregated = groupby.agg({col: collect_concat for col in columns})
 
             else:
                 raise Exception("Unsupported dataframe: {}".format(df))
 
+        # Reduce float columns with the compiled numba kernels when available
+        elif isinstance(df, pd.DataFrame) and njit is not None and agg in NUMBA_AGGREGATIONS and \
+                all(pd.api.types.is_float_dtype(df[col]) for col in columns):
+            aggregated = groupby_aggregate(df[columns], keys, agg)
+            aggregated.index.name = index
+
         # Any other aggregation functions
         else:
             aggregated = groupby.agg({col: agg for col in columns})
 
         # if aggregated.index.duplicated().sum() > 0:
         #     raise ValueError("DataFrame must not have duplicates in index")
+        if isinstance(aggregated, pd.DataFrame):
+            self._annotations_cache[cache_key] = aggregated
+            if filter_values is not None:
+                aggregated = aggregated[aggregated.index.isin(list(filter_values))]
+            aggregated = aggregated.copy(deep=False)
+
         return aggregated
 
     def get_expressions(self, index):
@@ -245,8 +326,15 @@ class Database(object):
         Args:
             index:
         """
-        return self.data.groupby(index).median(
-        )  # TODO if index by gene, aggregate medians of transcript-level expressions
+        # TODO if index by gene, aggregate medians of transcript-level expressions
+        if isinstance(self.data, pd.DataFrame) and njit is not None:
+            expressions = self.data.drop(columns=[index])
+            if all(pd.api.types.is_float_dtype(dtype) for dtype in expressions.dtypes):
+                expressions = groupby_aggregate(expressions, self.data[index], "median", sort=True)
+                expressions.index.name = index
+                return expressions
+
+        return self.data.groupby(index).median()
 
 
 
@@ -284,7 +372,7 @@ class Annotatable(ABC):
         if gene_list is None:
             gene_list = self.get_genes_list()
 
-        self.annotations = pd.DataFrame(index=gene_list)
+        self.annotations = to_arrow_strings(pd.DataFrame(index=gene_list))
         self.annotations.index.name = index
 
     def annotate_attributes(self, database: Database, on: str, columns: List[str], agg: str = "concat",
@@ -292,21 +380,22 @@ class Annotatable(ABC):
         """Performs a left outer join between the annotation and Database's
         DataFrame, on the index key. The index argument must be column present
         in both DataFrames. If there exists overlapping columns from the join,
-        then .fillna() is used to fill NaN values in the old column with non-NaN
-        values from the new column.
+        then the NaN values in the old column are filled with non-NaN values
+        from the new column.
 
         Args:
             database (Database): Database which contains an dataframe.
             on (str): The column name which exists in both the annotations and
-                Database dataframe to perform the join on.
+                Database dataframe to perform the join on. It can also be the
+                annotations' index name, or one of its MultiIndex level names.
             columns ([str]): a list of column name to join to the annotation.
             agg (str): Function to aggregate when there is more than one values
                 for each index instance. E.g. ['first', 'last', 'sum', 'mean',
                 'concat'], default 'concat'.
             fuzzy_match (bool): default False. Whether to join the annotation by
-                applying a fuzzy match on the index with
-                difflib.get_close_matches(). It is very computationally
-                expensive and thus should only be used sparingly.
+                applying a fuzzy match on the index with `fuzzy_match_index()`.
+                It is computationally expensive and thus should only be used
+                sparingly.
         """
         if not hasattr(self, "annotations"):
             raise Exception("Must run .initialize_annotations() on, ", self.__class__.__name__, " first.")
@@ -315,6 +404,8 @@ class Annotatable(ABC):
             filter_values = self.annotations[on]
         elif on == self.annotations.index.name:
             filter_values = self.annotations.index
+        elif on in self.annotations.index.names:
+            filter_values = self.annotations.index.get_level_values(on)
         else:
             filter_values = None
 
@@ -324,46 +415,35 @@ class Annotatable(ABC):
             logging.warning("Database annotations is empty and has nothing to annotate.")
             return
 
+        # The aggregated database annotations are small (at most one row per gene), so bring them in-memory
+        if isinstance(database_df, dd.DataFrame):
+            database_df = database_df.compute()
+
         if fuzzy_match:
-            database_df.index = database_df.index.map(
-                lambda x: difflib.get_close_matches(x, self.annotations.index, n=1)[0])
-
-        # performing join on the index column
-        if on == self.annotations.index.name and isinstance(database_df, pd.DataFrame):
-            new_annotations = self.annotations.join(database_df,
-                                                    on=on,
-                                                    rsuffix="_")
-        # elif on == self.annotations.index.name and isinstance(database_df, dd.DataFrame):
-        #     new_annotations = dd.merge(self.annotations, database_df, how="left", on=on, suffixes=("_", ""))
-
-        # performing join on a different column
+            database_df.index = fuzzy_match_index(database_df.index, self.annotations.index)
+
+        # Left join against database_df, which is already indexed by `on`, either on the annotations' index or on
+        # one of its columns or MultiIndex levels, without resetting the annotations' index. Overlapping columns from
+        # the database get the "_" suffix.
+        if on == self.annotations.index.name:
+            new_annotations = self.annotations.merge(database_df, how="left", left_index=True, right_index=True,
+                                                     suffixes=("", "_"))
         else:
-            # if isinstance(self.annotations.index, pd.MultiIndex):
-            #     old_index = self.annotations.index.names
-            # else:
-            #     old_index = self.annotations.index.name
-
-            # Save old index, reset the old index, set_index to the join index, perform the join, then change back to the old index
-            # This also ensures the index in self.annotations aligns with the gene_index in self.expressions dataframes
-            # TODO: Could be very slow on dask dataframes
-            # new_annotations = self.annotations.reset_index()
-            # new_annotations = new_annotations.set_index(on)
-            # new_annotations = new_annotations.join(
-            #     database_df, on=on, rsuffix="_").reset_index()
-            # new_annotations = new_annotations.set_index(old_index)
-            new_annotations = dd.merge(self.annotations, database_df, how="left", on=on, suffixes=("_", ""))
+            new_annotations = self.annotations.merge(database_df, how="left", left_on=on, right_index=True,
+                                                     suffixes=("", "_"))
 
         # Merge columns if the database DataFrame has overlapping columns with existing column
         duplicate_cols = [col for col in new_annotations.columns \
                           if col[-1] == "_"]
 
-        # Fill in null values then drop duplicate columns
-        for new_col in duplicate_cols:
-            old_col = new_col.strip("_")
-            new_annotations[old_col].fillna(new_annotations[new_col],
-                                            inplace=True,
-                                            axis=0)
-            new_annotations = new_annotations.drop(columns=new_col)
+        # Fill in null values of all duplicate columns at once, then drop the duplicate columns. Both column subsets
+        # share the same index, so where() fills them without the index union and alignment of combine_first()
+        if duplicate_cols:
+            old_cols = [col[:-1] for col in duplicate_cols]
+            old_values = new_annotations[old_cols]
+            new_values = new_annotations[duplicate_cols].set_axis(old_cols, axis=1)
+            new_annotations[old_cols] = old_values.where(old_values.notnull(), new_values)
+            new_annotations = new_annotations.drop(columns=duplicate_cols)
 
         # Assign the new results
         self.annotations = new_annotations
@@ -390,18 +470,20 @@ class Annotatable(ABC):
         if omic is None:
             omic = self.name()
 
+        if type(self.annotations.index) == pd.MultiIndex:
+            keys = self.annotations.index.get_level_values(index)
+        else:
+            keys = self.annotations.index
+
+        # Only read the sequences of the genes in the annotations
+        kwargs.setdefault("keys", set(keys.dropna()))
+
         sequences_entries = database.get_sequences(index=index,
                                                    omic=omic,
                                                    agg_sequences=agg,
                                                    **kwargs)
 
-        if type(self.annotations.index) == pd.MultiIndex:
-            self.annotations[
-                Annotatable.SEQUENCE_COL_NAME] = self.annotations.index.get_level_values(
-                index).map(sequences_entries)
-        else:
-            self.annotations[Annotatable.SEQUENCE_COL_NAME] = self.annotations.index.map(
-                sequences_entries)
+        self.annotations[Annotatable.SEQUENCE_COL_NAME] = keys.map(sequences_entries)
 
     def annotate_expressions(self, database, index, fuzzy_match=False):
         """Annotate :param database: :param index: :param fuzzy_match:
@@ -443,10 +525,19 @@ class Annotatable(ABC):
         Args:
             new_index:
         """
-        self.annotations[new_index].fillna(self.annotations.index.to_series(),
-                                           axis=0,
-                                           inplace=True)
-        self.annotations = self.annotations.reset_index().set_index(new_index)
+        old_index = self.annotations.index
+        # Fill the missing new index values with the old index values by position, without aligning on the index
+        filled = self.annotations[new_index].where(self.annotations[new_index].notnull(), old_index.to_numpy())
+        annotations = self.annotations.assign(**{new_index: filled}).set_index(new_index)
+
+        # Keep every named level of the old index as a column, as with reset_index(), without another copy of the
+        # whole table
+        levels = [(i, name) for i, name in enumerate(old_index.names)
+                  if name is not None and name not in annotations.columns]
+        for loc, (i, name) in enumerate(levels):
+            annotations.insert(loc, name, old_index.get_level_values(i).to_numpy())
+
+        self.annotations = annotations
 
     def get_rename_dict(self, from_index, to_index):
         """Used to retrieve a lookup dictionary to convert from one index to
@@ -470,6 +561,79 @@ class Annotatable(ABC):
                          index=dataframe[from_index]).to_dict()
 
 
+def fuzzy_match_index(index: pd.Index, choices: pd.Index, cutoff=0.6):
+    """Replaces each value in `index` by its closest match among `choices`.
+    With rapidfuzz installed, the similarity scores are computed with
+    `process.cdist()` over all cores, on bounded chunks of `index`, otherwise
+    it falls back to calling `difflib.get_close_matches()` for each value.
+    Values without a match above the cutoff are kept as is.
+
+    Args:
+        index (pd.Index): The values to match.
+        choices (pd.Index): The candidate values.
+        cutoff (float): default 0.6. The minimum similarity ratio in [0, 1].
+
+    Returns:
+        pd.Index: The matched values.
+    """
+    if len(index) == 0 or len(choices) == 0:
+        return index
+    elif process is None:
+        return index.map(lambda x: next(iter(difflib.get_close_matches(x, choices, n=1, cutoff=cutoff)), x))
+
+    queries, choices = index.to_numpy(), choices.to_numpy()
+    matches = queries.copy()
+    # Score the queries in chunks, so that the uint8 score matrix stays under ~64 MB however many values there are
+    chunk_size = max(1, 2 ** 26 // len(choices))
+    for start in range(0, len(queries), chunk_size):
+        chunk = queries[start:start + chunk_size]
+        scores = process.cdist(chunk, choices, scorer=fuzz.ratio, score_cutoff=int(cutoff * 100),
+                               dtype=np.uint8, workers=-1)
+        best = scores.argmax(axis=1)
+        matched = scores[np.arange(len(best)), best] > 0
+        matches[start:start + len(chunk)] = np.where(matched, choices[best], chunk)
+
+    return pd.Index(matches, name=index.name)
+
+
+def extract_member(archive, filename, data_file):
+    """Extracts the member of a zip or rar archive whose file extension matches
+    `filename` into an "_extracted" folder next to the archive, unless it was
+    already extracted from the same archive by a previous call. Downstream
+    readers can then open the extracted file with their own C parsers instead of
+    streaming it through the archive's decompressor on every read.
+
+    Args:
+        archive (zipfile.ZipFile, rarfile.RarFile): The opened archive.
+        filename (str): The file resource name to match by file extension.
+        data_file (str): The path of the archive file.
+
+    Returns:
+        str: The path to the extracted file, or `data_file` if no member matched.
+    """
+    cache_dir = os.path.join(os.path.dirname(data_file), "_extracted")
+    extracted = data_file
+
+    for subfile in archive.infolist():
+        if os.path.splitext(subfile.filename)[-1] != os.path.splitext(filename)[-1]:  # If the file extension matches
+            continue
+
+        extracted = archive_member_path(cache_dir, subfile.filename)
+        # Reuse a previous extraction only if it has the member's size and is newer than the (re-)downloaded archive
+        if os.path.isfile(extracted) and os.path.getsize(extracted) == subfile.file_size and \
+                os.path.getmtime(extracted) >= os.path.getmtime(data_file):
+            continue
+
+        if isinstance(archive, zipfile.ZipFile):
+            extracted = extract_zip_member(archive, subfile, cache_dir)
+        else:
+            extracted = archive.extract(subfile, cache_dir)
+        # Extractors may restore the member's original timestamp, so mark the time of extraction instead
+        os.utime(extracted)
+
+    return extracted
+
+
 DEFAULT_LIBRARIES = [
     "10KImmunomes"
     "BioGRID"
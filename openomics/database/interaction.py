@@ -289,29 +289,51 @@ class STRING(Interactions, SequenceDatabase):
         network = nx.relabel_nodes(network, self.protein_id2name)
         return network
 
-    def get_sequences(self, index="protein_name", omic=None, agg_sequences=None):
-        if hasattr(self, "seq_dict"):
-            return self.seq_dict
-
-        self.seq_dict = {}
+    def get_sequences(self, index="protein_name", omic=None, agg_sequences=None, keys=None, **kwargs):
+        # Only the unfiltered sequences are cached, for each index and aggregation
+        if not hasattr(self, "_seq_dict_cache"):
+            self._seq_dict_cache = {}
+        if keys is None and (index, agg_sequences) in self._seq_dict_cache:
+            return self._seq_dict_cache[(index, agg_sequences)]
+
+        seq_dict = {}
         collisions = 0
         for record in SeqIO.parse(self.file_resources["protein.sequences.fa"], "fasta"):
             gene_id = str(record.name)
             gene_name = self.protein_id2name[gene_id]
-            sequence_str = str(record.seq)
             if index == "protein_name":
                 key = gene_name
             elif index == "protein_id":
                 key = gene_id
 
+            # Skip building the sequence string of unselected keys
+            if keys is not None and key not in keys:
+                continue
+
+            sequence_str = str(record.seq)
+            if agg_sequences == "all":
+                seq_dict.setdefault(key, []).append(sequence_str)
+                continue
 
-            if key in self.seq_dict:
-                collisions += 1
+            current = seq_dict.get(key)
+            if current is None:
+                seq_dict[key] = sequence_str
+                continue
 
-            self.seq_dict[key] = sequence_str
+            collisions += 1
+            if agg_sequences == "longest":
+                if len(sequence_str) > len(current):
+                    seq_dict[key] = sequence_str
+            elif agg_sequences == "shortest":
+                if len(sequence_str) < len(current):
+                    seq_dict[key] = sequence_str
+            else:
+                seq_dict[key] = sequence_str
 
         logging.info("Seq {} collisions: {}".format(index, collisions))
-        return self.seq_dict
+        if keys is None:
+            self._seq_dict_cache[(index, agg_sequences)] = seq_dict
+        return seq_dict
 
 
 class LncBase(Interactions, Database):
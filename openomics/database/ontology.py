@@ -1,11 +1,25 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+
 import networkx as nx
 import numpy as np
-import obonet
 import pandas as pd
+import scipy.sparse as ssp
 from Bio.UniProt import GOA
+from obonet.io import open_read_file
 
+import openomics
 from .base import Database
 from ..utils.df import slice_adj
+from ..utils.io import file_resources_digest, mkdirs
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
 
 
 class Ontology(Database):
@@ -28,7 +42,10 @@ class Ontology(Database):
             npartitions:
             verbose:
         """
-        self.network, self.node_list = self.load_network(file_resources)
+        network, self.node_list = self.load_network(file_resources)
+        # A None network is built lazily by the subclass when it is first accessed
+        if network is not None:
+            self.network = network
 
         super(Ontology, self).__init__(
             path=path,
@@ -154,6 +171,7 @@ class GeneOntology(Ontology):
         "DB_Object_ID": "gene_id",
         "GO_ID": "go_id",
     }
+    LOADS_COLUMN_SUBSETS = True
 
     def __init__(
         self,
@@ -185,36 +203,105 @@ class GeneOntology(Ontology):
     def info(self):
         print("network {}".format(nx.info(self.network)))
 
-    def load_dataframe(self, file_resources, npartitions=None):
-        go_annotation_dfs = []
-        for file in file_resources:
-            if ".gaf" in file:
-                go_lines = []
-                for line in GOA.gafiterator(file_resources[file]):
-                    go_lines.append(line)
-                go_annotation_dfs.append(pd.DataFrame(go_lines))
+    def load_dataframe(self, file_resources, npartitions=None, columns=None):
+        """Parses the GAF files into a DataFrame of GO annotations. The result
+        is cached to openomics' cache directory, keyed by the names, sizes and
+        modification times of the file resources, so that instantiating the
+        GeneOntology again with the same files skips the parsing.
+
+        Args:
+            file_resources (dict):
+            npartitions: unused.
+            columns (list): default None. If given, only these GAF columns (and
+                "go_name", "namespace", or "is_a") are returned. They're read
+                from the cache, which is first written with all the columns if
+                it's missing. Only if the file resources can't be cached, just
+                these columns are parsed.
+        """
+        digest = file_resources_digest(file_resources)
+        cache_file = os.path.join(openomics.config["cache_dir"], "GeneOntology",
+                                  "{}.{}".format(digest, "parquet" if pa is not None else "pickle")) \
+            if digest is not None else None
+
+        if cache_file is None:
+            return self.parse_go_annotations(file_resources, columns=columns)
+
+        if not os.path.exists(cache_file):
+            go_annotations = self.parse_go_annotations(file_resources)
+            mkdirs(os.path.dirname(cache_file))
+            if pa is not None:
+                go_annotations.to_parquet(cache_file, compression="zstd")
+            else:
+                go_annotations.to_pickle(cache_file)
 
-        go_annotations = pd.concat(go_annotation_dfs)
+            if columns is None:
+                return go_annotations
+            return go_annotations[[col for col in go_annotations.columns if col in columns]]
 
-        go_terms = pd.DataFrame.from_dict(self.network.nodes,
-                                          orient="index",
-                                          dtype="object")
+        return read_go_annotations_cache(cache_file, columns=columns)
 
-        go_annotations["go_name"] = go_annotations["GO_ID"].map(
-            go_terms["name"])
-        go_annotations["namespace"] = go_annotations["GO_ID"].map(
-            go_terms["namespace"])
-        go_annotations["is_a"] = go_annotations["GO_ID"].map(go_terms["is_a"])
+    def parse_go_annotations(self, file_resources, columns=None):
+        """
+        Args:
+            file_resources (dict):
+            columns (list): default None. The subset of columns to parse.
+        """
+        term_columns = [("go_name", "name"), ("namespace", "namespace"), ("is_a", "is_a")]
+        usecols = None
+        if columns is not None:
+            term_columns = [(col, term_col) for col, term_col in term_columns if col in columns]
+            # The GO term columns are gathered by the GO_ID column
+            usecols = [col for col in GOA.GAF20FIELDS if col in columns or (col == "GO_ID" and term_columns)]
+
+        gaf_files = [content for filename, content in file_resources.items() if ".gaf" in filename]
+
+        # Parse the GAF files concurrently, as the C parser of read_csv releases the GIL
+        with ThreadPoolExecutor(max_workers=max(len(gaf_files), 1)) as executor:
+            go_annotations = pd.concat(list(executor.map(lambda file: read_gaf(file, usecols=usecols), gaf_files)),
+                                       ignore_index=True)
+
+        # The low-cardinality columns are stored as integer codes into their unique values
+        go_annotations = go_annotations.astype({col: "category" for col in GAF_CATEGORICAL_COLUMNS \
+                                                if col in go_annotations.columns})
+
+        if term_columns:
+            # Look up the terms once for each GO_ID category, then gather them for every row by the category codes
+            go_terms = self.go_terms.reindex(go_annotations["GO_ID"].cat.categories)
+            codes = go_annotations["GO_ID"].cat.codes.to_numpy()
+            for col, term_col in term_columns:
+                # A trailing NaN is gathered for the -1 codes of missing GO_IDs
+                values = np.append(go_terms[term_col].to_numpy(), np.nan)
+                go_annotations[col] = values[codes]
+
+        if "namespace" in go_annotations.columns:
+            go_annotations["namespace"] = go_annotations["namespace"].astype("category")
 
         return go_annotations
 
     def load_network(self, file_resources):
+        """Parses the GO terms and their relationships from the .obo file into
+        `self.go_terms` and `self.go_edges`. The NetworkX graph is only built
+        from them when `self.network` is first accessed.
+
+        Args:
+            file_resources (dict):
+        """
         for file in file_resources:
             if ".obo" in file:
-                network = obonet.read_obo(file_resources[file])
-                # network = network.reverse(copy=True)
-                node_list = np.array(network.nodes)
-        return network, node_list
+                self.go_terms, self.go_edges = parse_obo(file_resources[file])
+                node_list = self.go_terms.index.to_numpy()
+        return None, node_list
+
+    @cached_property
+    def network(self):
+        """The ontology network with an edge from each term to its parent terms,
+        keyed by the relationship type, the same as `obonet.read_obo()`.
+        Assigning a new network, e.g. in `filter_network()`, replaces it.
+        """
+        network = nx.MultiDiGraph()
+        network.add_nodes_from(zip(self.go_terms.index, self.go_terms.to_dict(orient="records")))
+        network.add_edges_from(zip(self.go_edges["source"], self.go_edges["target"], self.go_edges["key"]))
+        return network
 
     def filter_network(self, namespace):
         """
@@ -229,25 +316,77 @@ class GeneOntology(Ontology):
         self.network = self.network.subgraph(nodes=list(terms))
         self.node_list = np.array(list(terms))
 
+    def get_ancestors_matrix(self):
+        """Computes the transitive closure of the ontology network as a sparse
+        matrix, where row i contains the ancestors of the i-th term. The result
+        is cached until `self.network` is reassigned.
+
+        Returns:
+            terms (pd.Index): The GO terms of the matrix rows and columns.
+            ancestors (ssp.csr_matrix): A boolean CSR matrix of term ancestors.
+        """
+        cache = getattr(self, "_ancestors_matrix", None)
+        if cache is not None and cache[0] is self.network:
+            return cache[1], cache[2]
+
+        terms = pd.Index(list(self.network.nodes))
+        edges = np.array(list(self.network.edges(keys=False)), dtype="O").reshape(-1, 2)
+        adj = ssp.csr_matrix((np.ones(len(edges), dtype=bool),
+                              (terms.get_indexer(edges[:, 0]), terms.get_indexer(edges[:, 1]))),
+                             shape=(len(terms), len(terms)))
+
+        # Square the reachability matrix until no new ancestors are found, doubling the path lengths each time
+        ancestors = adj
+        while True:
+            closure = (ancestors + ancestors @ ancestors).astype(bool)
+            if closure.nnz == ancestors.nnz:
+                break
+            ancestors = closure
+        ancestors.setdiag(False)
+        ancestors.eliminate_zeros()
+        ancestors.sort_indices()
+
+        self._ancestors_matrix = (self.network, terms, ancestors)
+        return terms, ancestors
+
     def get_predecessor_terms(self, annotation: pd.Series, type="is_a"):
+        """Returns the ancestor terms of each annotation's list of GO terms.
+        The ancestors of all the annotations' terms are gathered at once from
+        the rows of the cached sparse transitive closure.
 
-        go_terms_parents = annotation.map(lambda x: list({
-            parent
-            for term in x
-            for parent in list(nx.descendants(self.network, term))
-        }) if isinstance(x, list) else [
-        ])  # flatten(self.traverse_predecessors(term, type))}) \
-        return go_terms_parents
+        Args:
+            annotation (pd.Series): A Series of lists of GO terms.
+            type: unused.
+        """
+        terms_index, ancestors = self.get_ancestors_matrix()
+
+        # Explode on positions, since the annotation's index may have duplicates
+        terms = pd.Series(annotation.map(lambda x: x if isinstance(x, list) else []).values).explode().dropna()
+        codes = terms_index.get_indexer(terms)
+        terms = terms[codes >= 0]
+        rows = ancestors[codes[codes >= 0]]
+
+        parents = pd.DataFrame({"position": np.repeat(terms.index.to_numpy(), np.diff(rows.indptr)),
+                                "parent": rows.indices}).drop_duplicates()
+        parents = parents.sort_values("position", kind="mergesort")
+
+        positions, counts = np.unique(parents["position"].to_numpy(), return_counts=True)
+        go_terms_parents = [[] for _ in range(len(annotation))]
+        parent_terms = terms_index.to_numpy()[parents["parent"].to_numpy()]
+        for position, values in zip(positions, np.split(parent_terms, np.cumsum(counts)[:-1])):
+            go_terms_parents[position] = values.tolist()
+
+        return pd.Series(go_terms_parents, index=annotation.index, dtype="O")
 
     def add_predecessor_terms(self, annotation: pd.Series, return_str=False):
-        if (annotation.dtypes == np.object
+        if (annotation.dtypes == object
                 and annotation.str.contains("\||;", regex=True).any()):
             go_terms_annotations = annotation.str.split("|")
         else:
             go_terms_annotations = annotation
 
         go_terms_parents = go_terms_annotations + self.get_predecessor_terms(
-            annotation)
+            go_terms_annotations)
 
         if return_str:
             go_terms_parents = go_terms_parents.map(
@@ -256,6 +395,142 @@ class GeneOntology(Ontology):
         return go_terms_parents
 
 
+def read_go_annotations_cache(cache_file, columns=None):
+    """Reads the GO annotations cached by `GeneOntology.load_dataframe()`. As
+    parquet files restore strings as python-backed strings and lists as
+    arrays, those columns are converted back to their parsed dtypes.
+
+    Args:
+        cache_file (str): A ".parquet" or ".pickle" file path.
+        columns (list): default None. If given, only the cached columns among
+            these are read.
+    """
+    if not cache_file.endswith(".parquet"):
+        go_annotations = pd.read_pickle(cache_file)
+        return go_annotations[[col for col in go_annotations.columns if col in columns]] \
+            if columns is not None else go_annotations
+
+    if columns is not None:
+        cached_columns = pq.read_schema(cache_file).names
+        columns = [col for col in cached_columns if col in columns]
+    go_annotations = pd.read_parquet(cache_file, columns=columns)
+    for col in go_annotations.columns:
+        if col in GAF_LIST_COLUMNS or col == "is_a":
+            go_annotations[col] = go_annotations[col].map(lambda x: x.tolist() if isinstance(x, np.ndarray) else np.nan)
+        elif isinstance(go_annotations[col].dtype, pd.StringDtype):
+            go_annotations[col] = go_annotations[col].astype("string[pyarrow]")
+
+    return go_annotations
+
+
+OBO_TAG_LINE = re.compile(r"^(id|name|namespace|is_a|relationship|is_obsolete):\s*(.*?)"
+                          r"(?:\s+\{[^{}]*\})?(?:\s+!.*)?\s*$")
+
+
+def parse_obo(filepath_or_buffer, ignore_obsolete=True):
+    """Parses the [Term] stanzas of an OBO file in a single pass over its lines,
+    keeping only the tags needed to build the ontology, instead of building a
+    NetworkX graph of all tags with `obonet.read_obo()`.
+
+    Args:
+        filepath_or_buffer: A file path, URL, or opened file of the OBO file.
+        ignore_obsolete (bool): default True. Whether to skip terms marked
+            with "is_obsolete: true", the same as `obonet.read_obo()`.
+
+    Returns:
+        terms (pd.DataFrame): A DataFrame indexed by term id, with columns
+            "name", "namespace", and "is_a" (a list of parent ids, or NaN).
+        edges (pd.DataFrame): A DataFrame with columns "source", "key", and
+            "target", for each "is_a" or "relationship" of a child term.
+    """
+    ids, names, namespaces, parents = [], [], [], []
+    sources, keys, targets = [], [], []
+
+    term = None
+
+    def add_term(term):
+        if term is None or "id" not in term or (ignore_obsolete and term.get("is_obsolete") == "true"):
+            return
+        ids.append(term["id"])
+        names.append(term.get("name"))
+        namespaces.append(term.get("namespace"))
+        parents.append(term["is_a"] if term["is_a"] else np.nan)
+        for key, target in term["edges"]:
+            sources.append(term["id"])
+            keys.append(key)
+            targets.append(target)
+
+    with open_read_file(filepath_or_buffer, encoding="utf-8") as file:
+        for line in file:
+            if line.startswith("["):
+                add_term(term)
+                term = {"is_a": [], "edges": []} if line.startswith("[Term]") else None
+                continue
+            elif term is None:
+                continue
+
+            match = OBO_TAG_LINE.match(line)
+            if match is None:
+                continue
+            tag, value = match.groups()
+            if tag == "is_a":
+                term["is_a"].append(value)
+                term["edges"].append(("is_a", value))
+            elif tag == "relationship":
+                term["edges"].append(tuple(value.split(" ", 1)))
+            else:
+                term[tag] = value
+
+        add_term(term)
+
+    string_dtype = "string[pyarrow]" if pa is not None else object
+    terms = pd.DataFrame({"name": pd.array(names, dtype=string_dtype),
+                          "namespace": pd.array(namespaces, dtype=string_dtype),
+                          "is_a": pd.Series(parents, dtype="O").to_numpy()},
+                         index=pd.Index(ids, name="id"))
+    edges = pd.DataFrame({"source": sources, "key": keys, "target": targets}, dtype=string_dtype)
+
+    return terms, edges
+
+
+GAF_LIST_COLUMNS = ["Qualifier", "DB:Reference", "With", "Synonym", "Taxon_ID"]
+GAF_CATEGORICAL_COLUMNS = ["DB", "GO_ID", "Evidence", "Aspect", "DB_Object_Type"]
+
+
+def read_gaf(filepath_or_buffer, usecols=None):
+    """Reads a GAF 1.0 or 2.x file with pandas' C parser. The "|"-delimited
+    columns are split into lists, the same as with `GOA.gafiterator()`, and the
+    other columns are parsed directly into Arrow-backed strings if pyarrow is
+    installed.
+
+    Args:
+        filepath_or_buffer: A file path or a file-like object of the GAF file,
+            which is rewound if seekable. A local file path is memory-mapped,
+            so the C parser reads directly from the page cache.
+        usecols (list): default None. If given, only these GAF columns are
+            parsed.
+
+    Returns:
+        pd.DataFrame: A DataFrame with the GAF 2.x columns, where the columns
+        missing from GAF 1.0 files are null.
+    """
+    # Rewind file handles that may have already been read by a previous call
+    if hasattr(filepath_or_buffer, "seekable") and filepath_or_buffer.seekable():
+        filepath_or_buffer.seek(0)
+
+    gaf = pd.read_csv(filepath_or_buffer, sep="\t", comment="!", header=None, names=GOA.GAF20FIELDS,
+                      dtype="string[pyarrow]" if pa is not None else str, na_filter=False, quoting=3, engine="c",
+                      memory_map=isinstance(filepath_or_buffer, str) and os.path.isfile(filepath_or_buffer),
+                      usecols=usecols)
+
+    for col in GAF_LIST_COLUMNS:
+        if col not in gaf.columns:
+            continue
+        gaf[col] = gaf[col].str.split("|").astype(object)
+
+    return gaf
+
+
 def traverse_predecessors(network, seed_node, type=["is_a", "part_of"]):
     """
     Returns all successor terms from seed_node by traversing the ontology network with edges == `type`.
@@ -1,12 +1,14 @@
 import logging
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 
 import dask.dataframe as dd
 import pandas as pd
-from Bio import SeqIO
 
 import openomics
+from openomics.utils.groupby import select_by_length
+from openomics.utils.read_fasta import parse_fasta
 from openomics.utils.read_gtf import read_gtf
 from .base import Database
 
@@ -29,7 +31,7 @@ class SequenceDatabase(Database):
         super(SequenceDatabase, self).__init__(**kwargs)
 
     @abstractmethod
-    def read_fasta(self, fasta_file:str, replace_U2T:bool, npartitions=None):
+    def read_fasta(self, fasta_file:str, replace_U2T:bool, npartitions=None, index=None, keys=None):
         """Returns a pandas DataFrame containing the fasta sequence entries.
         With a column named 'sequence'.
 
@@ -38,11 +40,14 @@ class SequenceDatabase(Database):
                 self.file_resources[<file_name>]
             replace_U2T (bool):
             npartitions:
+            index (str): The column name to filter the entries on with `keys`.
+            keys (set): Default None. If given, only the entries with an `index`
+                value in `keys` are read.
         """
         raise NotImplementedError
 
     @abstractmethod
-    def get_sequences(self, index:str, omic:str, agg_sequences:str, **kwargs):
+    def get_sequences(self, index:str, omic:str, agg_sequences:str, keys=None, **kwargs):
         """Returns a dictionary where keys are 'index' and values are
         sequence(s).
 
@@ -51,6 +56,8 @@ class SequenceDatabase(Database):
                 "transcript_name"}
             omic (str): {"lncRNA", "microRNA", "messengerRNA"}
             agg_sequences (str): {"all", "shortest", "longest"}
+            keys (set): Default None. If given, only the sequences of these
+                keys are read.
             **kwargs: any additional argument to pass to
                 SequenceDataset.get_sequences()
         """
@@ -71,7 +78,7 @@ class SequenceDatabase(Database):
             agg_func = lambda x: min(x, key=len)
         elif agg == "longest":
             agg_func = lambda x: max(x, key=len)
-        elif isinstance(agg, callable):
+        elif callable(agg):
             return agg
         else:
             raise Exception(
@@ -79,6 +86,33 @@ class SequenceDatabase(Database):
             )
         return agg_func
 
+    @staticmethod
+    def aggregate_sequences(entries_df, index, agg):
+        """Groups the sequences in `entries_df` by `index`, and selects one or
+        more sequences for each key. The "shortest" and "longest" selections are
+        performed in a single pass over the sequence lengths with
+        `select_by_length()`, rather than calling the aggregator on each group.
+
+        Args:
+            entries_df (pd.DataFrame): A DataFrame from read_fasta() with a
+                'sequence' column.
+            index (str): The column name to group the sequences by.
+            agg: One of ("all", "shortest", "longest"), or a callable.
+
+        Returns:
+            pd.Series: A Series indexed by `index` with the selected sequence(s).
+        """
+        if agg in ("shortest", "longest"):
+            # Ties keep the first sequence in the file, as with min() and max()
+            uniques, positions = select_by_length(entries_df[index], entries_df["sequence"].str.len().to_numpy(),
+                                                  longest=(agg == "longest"))
+            return pd.Series(entries_df["sequence"].to_numpy()[positions], index=uniques.rename(index),
+                             name="sequence")
+        elif agg == "all":
+            return entries_df.groupby(index)["sequence"].apply(list)
+        else:
+            return entries_df.groupby(index)["sequence"].agg(SequenceDatabase.get_aggregator(agg))
+
 
 class GENCODE(SequenceDatabase):
     """Loads the GENCODE database from https://www.gencodegenes.org/ .
@@ -137,13 +171,14 @@ class GENCODE(SequenceDatabase):
             file_resources:
             npartitions:
         """
-        dfs = []
-        for filename, content in file_resources.items():
-            if ".gtf" in filename:
-                df = read_gtf(content,
-                              npartitions=npartitions,
-                              compression="gzip")
-                dfs.append(df)
+        gtf_files = [content for filename, content in file_resources.items() if ".gtf" in filename]
+
+        # Read the GTF files concurrently, as the C parser of read_csv releases the GIL
+        with ThreadPoolExecutor(max_workers=max(len(gtf_files), 1)) as executor:
+            dfs = list(executor.map(lambda content: read_gtf(content,
+                                                             npartitions=npartitions,
+                                                             compression="gzip"),
+                                    gtf_files))
 
         if npartitions:
             annotation_df = dd.concat(dfs)
@@ -151,57 +186,70 @@ class GENCODE(SequenceDatabase):
             annotation_df = pd.concat(dfs)
 
         if self.remove_version_num:
-            annotation_df["gene_id"] = annotation_df["gene_id"].str.replace(
-                "[.].*", "", regex=True)
-            annotation_df["transcript_id"] = annotation_df[
-                "transcript_id"].str.replace("[.].*", "", regex=True)
+            annotation_df["gene_id"] = annotation_df["gene_id"].str.split(".", n=1).str[0]
+            annotation_df["transcript_id"] = annotation_df["transcript_id"].str.split(".", n=1).str[0]
 
         return annotation_df
 
-    def read_fasta(self, fasta_file, replace_U2T, npartitions=None):
+    def read_fasta(self, fasta_file, replace_U2T, npartitions=None, index=None, keys=None):
         """
         Args:
             fasta_file:
             replace_U2T:
             npartitions:
+            index (str): The column name to filter the entries on with `keys`.
+            keys (set): Default None. If given, only the sequences of entries
+                with an `index` value in `keys` are read.
         """
-        entries = []
-        for record in SeqIO.parse(fasta_file, "fasta"):
-            record_dict = {
-                "gene_id": record.id.split("|")[1],
-                "gene_name": record.id.split("|")[5],
-                "transcript_id": record.id.split("|")[0],
-                "transcript_name": record.id.split("|")[4],
-                "transcript_length": record.id.split("|")[6],
-                "transcript_biotype": record.id.split("|")[7],
-                "sequence": str(record.seq),
-            }
+        select = None
+        if keys is not None:
+            select = lambda headers: self.parse_fasta_headers(headers)[index].isin(keys)
+
+        fasta_df = parse_fasta(fasta_file, replace_U2T=replace_U2T, select=select)
 
-            entries.append(record_dict)
+        entries_df = self.parse_fasta_headers(fasta_df)
+        entries_df["sequence"] = fasta_df["sequence"]
 
-        entries_df = pd.DataFrame(entries)
         if npartitions:
-            entries_df = dd.from_pandas(entries_df)
+            entries_df = dd.from_pandas(entries_df, npartitions=npartitions)
+
+        return entries_df
+
+    def parse_fasta_headers(self, headers):
+        """Splits the fasta headers into the gene and transcript fields.
+
+        Args:
+            headers (pd.DataFrame): A DataFrame from parse_fasta() with an 'id'
+                column.
+        """
+        # Header fields are "|"-delimited, e.g. "transcript_id|gene_id|...|transcript_name|gene_name|length|biotype|"
+        ids = headers["id"].str.split("|", expand=True)
+        entries_df = pd.DataFrame({
+            "gene_id": ids[1],
+            "gene_name": ids[5],
+            "transcript_id": ids[0],
+            "transcript_name": ids[4],
+            "transcript_length": ids[6],
+            "transcript_biotype": ids[7],
+        })
 
-        if replace_U2T:
-            entries_df["sequence"] = entries_df["sequence"].str.replace(
-                "U", "T")
         if self.remove_version_num:
-            entries_df["gene_id"] = entries_df["gene_id"].str.replace(
-                "[.].*", "")
-            entries_df["transcript_id"] = entries_df[
-                "transcript_id"].str.replace("[.].*", "")
+            entries_df["gene_id"] = entries_df["gene_id"].str.split(".", n=1).str[0]
+            entries_df["transcript_id"] = entries_df["transcript_id"].str.split(".", n=1).str[0]
         return entries_df
 
-    def get_sequences(self, index, omic, agg_sequences, biotypes=None):
+    def get_sequences(self, index, omic, agg_sequences, biotypes=None, keys=None):
         """
         Args:
             index (str):
             omic (str):
             agg_sequences (str):
             biotypes ([str]):
+            keys (set): Default None. If given, only the sequences of these
+                keys are read.
         """
-        agg_func = self.get_aggregator(agg_sequences)
+        # Validate agg_sequences before parsing the fasta file
+        self.get_aggregator(agg_sequences)
 
         # Parse lncRNA & mRNA fasta
         if omic == openomics.MessengerRNA.name():
@@ -212,7 +260,7 @@ class GENCODE(SequenceDatabase):
             raise Exception(
                 "omic argument must be one of {'MessengerRNA', 'LncRNA'}")
 
-        entries_df = self.read_fasta(fasta_file, self.replace_U2T)
+        entries_df = self.read_fasta(fasta_file, self.replace_U2T, index=index, keys=keys)
 
         if "gene" in index:
             if biotypes:
@@ -223,7 +271,7 @@ class GENCODE(SequenceDatabase):
                     "INFO: You can pass in a list of transcript biotypes to filter using the argument 'biotypes'."
                 )
 
-            return entries_df.groupby(index)["sequence"].agg(agg_func)
+            return self.aggregate_sequences(entries_df, index, agg_sequences)
         elif "transcript" in index:
             return entries_df.groupby(index)["sequence"].first()
         else:
@@ -301,41 +349,44 @@ class MirBase(SequenceDatabase):
             file_resources:
             npartitions:
         """
-        rnacentral_mirbase = pd.read_table(
-            file_resources["rnacentral.mirbase.tsv"],
-            low_memory=True,
-            header=None,
-            names=[
-                "RNAcentral id",
-                "database",
-                "mirbase id",
-                "species",
-                "RNA type",
-                "NA",
-            ],
-        )
+        # The two tables are independent, so they are read concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            rnacentral_mirbase = executor.submit(
+                pd.read_table,
+                file_resources["rnacentral.mirbase.tsv"],
+                low_memory=True,
+                header=None,
+                names=[
+                    "RNAcentral id",
+                    "database",
+                    "mirbase id",
+                    "species",
+                    "RNA type",
+                    "NA",
+                ],
+                usecols=["RNAcentral id", "database", "mirbase id", "species", "RNA type"],
+                dtype={"database": "category", "species": "int32", "RNA type": "category"},
+            )
+            mirbase_aliases = executor.submit(
+                pd.read_table,
+                file_resources["aliases.txt"],
+                low_memory=True,
+                header=None,
+                names=["mirbase id", "gene_name"],
+                dtype="O",
+            )
+            rnacentral_mirbase = rnacentral_mirbase.result()
+            mirbase_aliases = mirbase_aliases.result().set_index("mirbase id")
 
         rnacentral_mirbase = rnacentral_mirbase.set_index("mirbase id")
-        rnacentral_mirbase["species"] = rnacentral_mirbase["species"].astype(
-            "O")
         if self.species_id is not None:
             rnacentral_mirbase = rnacentral_mirbase[
-                rnacentral_mirbase["species"] == self.species_id]
-
-        mirbase_aliases = pd.read_table(
-            file_resources["aliases.txt"],
-            low_memory=True,
-            header=None,
-            names=["mirbase id", "gene_name"],
-            dtype="O",
-        ).set_index("mirbase id")
+                rnacentral_mirbase["species"] == int(self.species_id)]
+
         mirbase_aliases = mirbase_aliases.join(rnacentral_mirbase, how="inner")
 
         # Expanding miRNA names in each MirBase Ascension ID
-        mirna_names = (mirbase_aliases.apply(
-            lambda x: pd.Series(x["gene_name"].split(";")[:-1]),
-            axis=1).stack().reset_index(level=1, drop=True))
-
+        mirna_names = mirbase_aliases["gene_name"].str.split(";").str[:-1].explode().dropna()
         mirna_names.name = "gene_name"
 
         if npartitions:
@@ -350,48 +401,66 @@ class MirBase(SequenceDatabase):
 
         return mirbase_aliases
 
-    def read_fasta(self, fasta_file, replace_U2T, npartitions=None):
+    def read_fasta(self, fasta_file, replace_U2T, npartitions=None, index=None, keys=None):
         """
         Args:
             fasta_file:
             replace_U2T:
             npartitions:
+            index (str): The column name to filter the entries on with `keys`.
+            keys (set): Default None. If given, only the sequences of entries
+                with an `index` value in `keys` are read.
         """
-        entries = []
-        for record in SeqIO.parse(fasta_file, "fasta"):
-            record_dict = {
-                "gene_id": record.id,
-                "gene_name": str(record.name),
-                "mirbase id": record.description.split(" ")[1],
-                "mir_name": record.description.split(" ")[5],
-                "species": " ".join(record.description.split(" ")[2:4]),
-                "sequence": str(record.seq),
-            }
+        select = None
+        if keys is not None:
+            select = lambda headers: self.parse_fasta_headers(headers)[index].isin(keys)
 
-            entries.append(record_dict)
+        fasta_df = parse_fasta(fasta_file, replace_U2T=replace_U2T, select=select)
+
+        entries_df = self.parse_fasta_headers(fasta_df)
+        entries_df["sequence"] = fasta_df["sequence"]
 
-        entries_df = pd.DataFrame(entries)
         if npartitions:
-            entries_df = dd.from_pandas(entries_df)
+            entries_df = dd.from_pandas(entries_df, npartitions=npartitions)
 
-        if replace_U2T:
-            entries_df["sequence"] = entries_df["sequence"].str.replace(
-                "U", "T")
+        return entries_df
+
+    def parse_fasta_headers(self, headers):
+        """Splits the fasta headers into the miRNA name, accession and species
+        fields.
+
+        Args:
+            headers (pd.DataFrame): A DataFrame from parse_fasta() with 'id' and
+                'description' columns.
+        """
+        # Headers are space-delimited, e.g. "hsa-let-7a-1 MI0000060 Homo sapiens let-7a-1 stem-loop"
+        fields = headers["description"].str.split(" ")
+        entries_df = pd.DataFrame({
+            "gene_id": headers["id"],
+            "gene_name": headers["id"],
+            "mirbase id": fields.str[1],
+            "mir_name": fields.str[5],
+            "species": fields.str[2:4].str.join(" "),
+        })
         return entries_df
 
     def get_sequences(self,
                       index="gene_name",
                       omic=None,
                       agg_sequences="all",
+                      keys=None,
                       **kwargs):
         """
         Args:
             index:
             omic:
             agg_sequences:
+            keys (set): Default None. If given, only the sequences of these
+                keys are read.
             **kwargs:
         """
-        if hasattr(self, "seq_dict"):
+        # Only the unfiltered sequences are cached
+        if keys is None and hasattr(self, "seq_dict"):
             logging.info("Using cached sequences dict")
             return self.seq_dict
 
@@ -402,9 +471,9 @@ class MirBase(SequenceDatabase):
         else:
             raise Exception("sequence must be either 'hairpin' or 'mature'")
 
-        fasta_df = self.read_fasta(file, self.replace_U2T)
-
-        self.seq_dict = fasta_df.set_index(index)["sequence"].agg(
-            self.get_aggregator(agg_sequences))
+        fasta_df = self.read_fasta(file, self.replace_U2T, index=index, keys=keys)
+        seq_dict = self.aggregate_sequences(fasta_df, index, agg_sequences)
 
-        return self.seq_dict
+        if keys is None:
+            self.seq_dict = seq_dict
+        return seq_dict
@@ -1,2 +1,3 @@
 from .io import get_pkg_data_filename
+from .read_fasta import parse_fasta
 from .read_gtf import read_gtf
@@ -1,18 +1,61 @@
 import numpy as np
 import pandas as pd
 
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
 
 def concat_uniques(series: pd.Series):
     """ An aggregation custom function to be applied to each column of a groupby
     Args:
         series (pd.Series):
     """
-    series_str = series.dropna().astype(str)
-    if not series_str.empty:
-        return "|".join(series_str.unique())
+    uniques = pd.unique(series.dropna().to_numpy())
+    if len(uniques):
+        return "|".join(map(str, uniques))
     else:
         return None
 
+def groupby_concat_uniques(keys, values, sep="|", as_list=False):
+    """Aggregates the unique non-null `values` of each unique key, in order of
+    first appearance. Rather than calling a function for each group, the
+    (key, value) pairs are deduplicated and sorted by key once, then the values
+    array is split at the group boundaries.
+
+    Args:
+        keys (array-like): The group key of each row. Rows with null keys are
+            dropped, as with groupby.
+        values (array-like): The values of each row.
+        sep (str): default "|".
+        as_list (bool): default False. Whether to return lists of the unique
+            values instead of `sep`-joined strings.
+
+    Returns:
+        pd.Series: A Series indexed by the unique keys.
+    """
+    codes, uniques = pd.factorize(keys, sort=False)
+    # Deduplicate integer codes of the values rather than the values themselves, so that Arrow-backed strings are
+    # only converted to Python objects once per unique value
+    value_codes, value_uniques = pd.factorize(values, sort=False)
+
+    mask = (codes >= 0) & (value_codes >= 0)
+    pairs = pd.DataFrame({"code": codes[mask], "value": value_codes[mask]}).drop_duplicates()
+    pairs = pairs.sort_values("code", kind="mergesort")
+
+    counts = np.bincount(pairs["code"].to_numpy(), minlength=len(uniques))
+    values = np.asarray(value_uniques, dtype=object)[pairs["value"].to_numpy()]
+    groups = np.split(values, np.cumsum(counts)[:-1]) if len(uniques) else []
+
+    if as_list:
+        aggregated = [group.tolist() for group in groups]
+    else:
+        aggregated = [sep.join(map(str, group)) if len(group) else None for group in groups]
+
+    return pd.Series(aggregated, index=pd.Index(uniques), dtype=object)
+
+
 def concat(series: pd.Series):
     """
     Args:
@@ -25,6 +68,30 @@ def concat(series: pd.Series):
         return None
 
 
+def to_arrow_strings(df: pd.DataFrame):
+    """Converts the object columns and index of a DataFrame which only contain
+    strings to the Arrow-backed "string[pyarrow]" dtype, which stores the
+    strings in contiguous buffers. Columns of other Python objects (e.g. lists)
+    are left as is. Returns the DataFrame unchanged if pyarrow isn't installed.
+
+    Args:
+        df (pd.DataFrame):
+    """
+    if pa is None or not isinstance(df, pd.DataFrame):
+        return df
+
+    string_cols = [col for col in df.columns[df.dtypes == object] \
+                   if pd.api.types.infer_dtype(df[col], skipna=True) == "string"]
+    if string_cols:
+        df = df.astype({col: "string[pyarrow]" for col in string_cols})
+
+    if not isinstance(df.index, pd.MultiIndex) and df.index.dtype == object and \
+            pd.api.types.infer_dtype(df.index, skipna=True) == "string":
+        df.index = df.index.astype("string[pyarrow]")
+
+    return df
+
+
 def drop_duplicate_columns(df):
     """
     Args:
@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+
+def _select_by_length(codes, lengths, n_groups, longest):
+    """Scans the rows once and keeps the position of the longest (or shortest)
+    row for each group code. Ties are resolved by keeping the first row.
+
+    Args:
+        codes (np.ndarray): int64 group codes, where -1 denotes a missing key.
+        lengths (np.ndarray): int64 lengths of each row.
+        n_groups (int): The number of unique group codes.
+        longest (bool): Whether to select the longest rather than the shortest.
+    """
+    positions = np.full(n_groups, -1, dtype=np.int64)
+    best = np.zeros(n_groups, dtype=np.int64)
+    for i in range(codes.size):
+        code = codes[i]
+        if code < 0:
+            continue
+        length = lengths[i]
+        if positions[code] < 0 or (longest and length > best[code]) or (not longest and length < best[code]):
+            best[code] = length
+            positions[code] = i
+    return positions
+
+
+if njit is not None:
+    _select_by_length = njit(cache=True, nogil=True)(_select_by_length)
+
+
+def select_by_length(keys, lengths, longest=True):
+    """Selects the position of the longest or shortest row for each unique key.
+    If numba is installed, the selection runs as a single compiled loop over the
+    rows, otherwise it falls back to a lexsort over the (key, length) pairs.
+
+    Args:
+        keys (pd.Series): The group keys of each row. Null keys are ignored.
+        lengths (np.ndarray): The length of each row.
+        longest (bool): Whether to select the longest rather than the shortest.
+
+    Returns:
+        uniques (pd.Index): The sorted unique keys.
+        positions (np.ndarray): The row position selected for each unique key.
+    """
+    codes, uniques = pd.factorize(keys, sort=True)
+    codes = codes.astype(np.int64, copy=False)
+    lengths = np.asarray(lengths, dtype=np.int64)
+
+    if njit is not None:
+        positions = _select_by_length(codes, lengths, len(uniques), longest)
+    else:
+        # The last lexsort key is the primary one, and the row positions break the ties
+        order = np.lexsort((np.arange(codes.size), -lengths if longest else lengths, codes))
+        order = order[codes[order] >= 0]
+        is_first = np.ones(order.size, dtype=bool)
+        is_first[1:] = codes[order][1:] != codes[order][:-1]
+        positions = order[is_first]
+
+    return pd.Index(uniques), positions
+
+
+def _group_sum_count(codes, values, n_groups):
+    """Sums the non-NaN values and counts them for each group code.
+
+    Args:
+        codes (np.ndarray): int64 group codes, where -1 denotes a missing key.
+        values (np.ndarray): float64 values of each row.
+        n_groups (int): The number of unique group codes.
+    """
+    sums = np.zeros(n_groups, dtype=np.float64)
+    counts = np.zeros(n_groups, dtype=np.int64)
+    for i in range(codes.size):
+        code = codes[i]
+        value = values[i]
+        if code < 0 or np.isnan(value):
+            continue
+        sums[code] += value
+        counts[code] += 1
+    return sums, counts
+
+
+def _group_min_max(codes, values, n_groups, maximum):
+    """Selects the minimum or maximum non-NaN value for each group code.
+
+    Args:
+        codes (np.ndarray): int64 group codes, where -1 denotes a missing key.
+        values (np.ndarray): float64 values of each row.
+        n_groups (int): The number of unique group codes.
+        maximum (bool): Whether to select the maximum rather than the minimum.
+    """
+    out = np.full(n_groups, np.nan, dtype=np.float64)
+    for i in range(codes.size):
+        code = codes[i]
+        value = values[i]
+        if code < 0 or np.isnan(value):
+            continue
+        if np.isnan(out[code]) or (maximum and value > out[code]) or (not maximum and value < out[code]):
+            out[code] = value
+    return out
+
+
+def _group_median(codes, values, n_groups):
+    """Computes the median of the non-NaN values for each group code, with the
+    groups processed in parallel after a single sort of the rows by code.
+
+    Args:
+        codes (np.ndarray): int64 group codes, where -1 denotes a missing key.
+        values (np.ndarray): float64 values of each row.
+        n_groups (int): The number of unique group codes.
+    """
+    order = np.argsort(codes, kind="mergesort")
+    starts = np.searchsorted(codes[order], np.arange(n_groups + 1))
+
+    out = np.full(n_groups, np.nan, dtype=np.float64)
+    for code in prange(n_groups):
+        group = values[order[starts[code]:starts[code + 1]]]
+        group = group[~np.isnan(group)]
+        if group.size:
+            out[code] = np.median(group)
+    return out
+
+
+if njit is not None:
+    _group_sum_count = njit(cache=True, nogil=True)(_group_sum_count)
+    _group_min_max = njit(cache=True, nogil=True)(_group_min_max)
+    _group_median = njit(cache=True, nogil=True, parallel=True)(_group_median)
+
+NUMBA_AGGREGATIONS = ("sum", "mean", "min", "max", "median")
+
+
+def groupby_aggregate(df: pd.DataFrame, keys, how: str, sort=False):
+    """Aggregates each float column of `df` by the group `keys` with compiled
+    numba kernels, with the same NaN-skipping results as pandas' groupby
+    reductions. Requires numba, and only supports the NUMBA_AGGREGATIONS.
+
+    Args:
+        df (pd.DataFrame): A DataFrame of float64 or float32 columns.
+        keys (array-like): The group key of each row. Rows with null keys are
+            dropped, as with groupby.
+        how (str): One of {"sum", "mean", "min", "max", "median"}.
+        sort (bool): default False. Whether to sort the result by the keys
+            instead of by the order of first appearance.
+
+    Returns:
+        pd.DataFrame: A DataFrame indexed by the unique keys.
+    """
+    if njit is None:
+        raise Exception("numba must be installed to use groupby_aggregate()")
+    if how not in NUMBA_AGGREGATIONS:
+        raise Exception("how must be one of {}".format(NUMBA_AGGREGATIONS))
+
+    codes, uniques = pd.factorize(keys, sort=sort)
+    codes = codes.astype(np.int64, copy=False)
+    n_groups = len(uniques)
+
+    aggregated = {}
+    for col in df.columns:
+        values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        if how in ("sum", "mean"):
+            sums, counts = _group_sum_count(codes, values, n_groups)
+            if how == "sum":
+                aggregated[col] = sums
+            else:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    aggregated[col] = sums / counts
+        elif how in ("min", "max"):
+            aggregated[col] = _group_min_max(codes, values, n_groups, how == "max")
+        else:
+            aggregated[col] = _group_median(codes, values, n_groups)
+
+    return pd.DataFrame(aggregated, index=pd.Index(uniques), columns=df.columns)
@@ -1,7 +1,12 @@
 import errno
+import gzip
+import hashlib
 import io
 import logging
 import os
+import struct
+import weakref
+import zipfile
 from urllib.error import URLError
 
 import dask.dataframe as dd
@@ -14,6 +19,22 @@ from requests.adapters import HTTPAdapter, Retry
 
 import openomics
 
+try:
+    import rapidgzip
+except ImportError:
+    rapidgzip = None
+
+try:
+    import indexed_gzip
+except ImportError:
+    indexed_gzip = None
+
+try:
+    from isal import igzip, isal_zlib
+except ImportError:
+    igzip = None
+    isal_zlib = None
+
 
 # @astropy.config.set_temp_cache(openomics.config["cache_dir"])
 def get_pkg_data_filename(dataurl, file):
@@ -111,3 +132,131 @@ def get_decompressed_text_gzip(gzip_file):
     return io.TextIOWrapper(gzip_file)
     # decompressedFile = gzip.GzipFile(fileobj=gzip_file, mode='rb')
     # return decompressedFile
+
+
+def open_gzip(filepath):
+    """Opens a gzip compressed file for reading as text, with a parallel gzip
+    decoder when one is installed. Tries `rapidgzip`, which decompresses with
+    all available cores, then the ISA-L backed `isal.igzip`, then
+    `indexed_gzip`, and falls back to the standard `gzip` module.
+
+    Args:
+        filepath (str): Path to the gzip file.
+
+    Returns:
+        io.TextIOWrapper: A text file handle of the decompressed content.
+    """
+    if rapidgzip is not None:
+        file = rapidgzip.RapidgzipFile(filepath, parallelization=os.cpu_count())
+        text_file = io.TextIOWrapper(file)
+        # The decoder threads abort the interpreter at exit unless the file was closed, so close it once the handle
+        # is garbage collected, or at exit if it's still alive then
+        weakref.finalize(text_file, file.close)
+        return text_file
+    elif igzip is not None:
+        return igzip.open(filepath, "rt")
+    elif indexed_gzip is not None:
+        return io.TextIOWrapper(indexed_gzip.IndexedGzipFile(filepath))
+    else:
+        return gzip.open(filepath, "rt")
+
+
+def file_resources_digest(file_resources):
+    """Hashes the names, sizes and modification times of the local files in
+    `file_resources`, e.g. to key a cache of the DataFrame parsed from them.
+
+    Args:
+        file_resources (dict): A dictionary of file names to file paths or
+            opened file handles.
+
+    Returns:
+        str: A hex digest, or None if any of the file resources isn't a local
+        file, e.g. a URL or a file handle without a path.
+    """
+    parts = []
+    for filename, content in sorted(file_resources.items()):
+        filepath = content if isinstance(content, str) else getattr(content, "name", None)
+        if not isinstance(filepath, str) or not os.path.isfile(filepath):
+            return None
+
+        stat = os.stat(filepath)
+        parts.append("{}:{}:{}:{}".format(filename, os.path.basename(filepath), stat.st_size, stat.st_mtime_ns))
+
+    return hashlib.blake2s("|".join(parts).encode()).hexdigest()
+
+
+def archive_member_path(path, filename):
+    """Returns the path that an archive member is extracted to within `path`.
+    The member name is sanitized the same way as by `ZipFile.extract()`, which
+    drops drive letters, leading separators, and "." or ".." components.
+
+    Args:
+        path (str): The folder to extract the member into.
+        filename (str): The member's file name in the archive.
+
+    Returns:
+        str: The path to extract the member to.
+    """
+    arcname = filename.replace("/", os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    arcname = os.path.sep.join(part for part in arcname.split(os.path.sep) \
+                               if part not in ("", os.path.curdir, os.path.pardir))
+
+    target = os.path.join(path, arcname)
+    real_path = os.path.realpath(path)
+    if not os.path.realpath(target).startswith(real_path + os.path.sep):
+        raise Exception("Refusing to extract {}, which escapes {}".format(filename, path))
+
+    return target
+
+
+def extract_zip_member(zf, member, path, chunksize=2 ** 22):
+    """Extracts a member of a zip archive to the `path` folder. DEFLATE members
+    are decompressed with the ISA-L backed `isal_zlib` when installed, by
+    reading the raw compressed stream after the member's local file header.
+    Otherwise it falls back to `ZipFile.extract()`, which decompresses with zlib.
+
+    Args:
+        zf (zipfile.ZipFile): The opened zip archive.
+        member (zipfile.ZipInfo): The member to extract.
+        path (str): The folder to extract the member into.
+        chunksize (int): default 4MB. The number of compressed bytes read at a
+            time.
+
+    Returns:
+        str: The path to the extracted file.
+    """
+    if isal_zlib is None or member.compress_type != zipfile.ZIP_DEFLATED or member.flag_bits & 0x1:
+        return zf.extract(member, path)
+
+    target = archive_member_path(path, member.filename)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    with open(zf.filename, "rb") as archive, open(target, "wb") as out:
+        # The local file header has a fixed size of 30 bytes, followed by the file name and extra field
+        archive.seek(member.header_offset)
+        header = archive.read(zipfile.sizeFileHeader)
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        archive.seek(name_length + extra_length, os.SEEK_CUR)
+
+        decompressor = isal_zlib.decompressobj(-isal_zlib.MAX_WBITS)
+        remaining, crc = member.compress_size, 0
+        while remaining > 0:
+            chunk = archive.read(min(chunksize, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            content = decompressor.decompress(chunk)
+            crc = isal_zlib.crc32(content, crc)
+            out.write(content)
+        content = decompressor.flush()
+        out.write(content)
+        crc = isal_zlib.crc32(content, crc)
+
+    if crc != member.CRC:
+        os.remove(target)
+        raise Exception("Bad CRC-32 for file {} in {}".format(member.filename, zf.filename))
+
+    return target
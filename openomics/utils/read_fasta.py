@@ -0,0 +1,85 @@
+import gzip
+
+import numpy as np
+import pandas as pd
+
+WHITESPACE = b" \t\r\n"
+U2T = bytes.maketrans(b"Uu", b"Tt")
+
+
+def read_bytes(filepath_or_buffer):
+    """Reads the whole content of a file path or an opened file handle as bytes.
+
+    Args:
+        filepath_or_buffer: A file path (gzip compressed if ending with ".gz"),
+            or a file-like object opened in either text or binary mode.
+
+    Returns:
+        content (bytes):
+    """
+    if isinstance(filepath_or_buffer, str):
+        opener = gzip.open if filepath_or_buffer.endswith(".gz") else open
+        with opener(filepath_or_buffer, "rb") as file:
+            return file.read()
+
+    # Rewind file handles that may have already been read by a previous call
+    if hasattr(filepath_or_buffer, "seekable") and filepath_or_buffer.seekable():
+        filepath_or_buffer.seek(0)
+
+    # Read from the binary stream underneath a text wrapper to skip decoding
+    file = getattr(filepath_or_buffer, "buffer", filepath_or_buffer)
+    content = file.read()
+    if isinstance(content, str):
+        content = content.encode()
+
+    return content
+
+
+def parse_fasta(filepath_or_buffer, replace_U2T=False, select=None):
+    """Parses all records in a FASTA file at once. The record boundaries are
+    located with `bytes.find()` over the raw content, then each record's
+    sequence is sliced from the content and its line breaks are dropped with a
+    single `bytes.translate()` call, rather than joining the lines one by one.
+
+    Args:
+        filepath_or_buffer: A file path or file-like object of the FASTA file.
+        replace_U2T (bool): Whether to replace nucleotides from U to T.
+        select (callable): Default None. A function which takes the DataFrame of
+            headers with columns "id" and "description", and returns a boolean
+            mask of the records to keep. The sequences of the other records are
+            never sliced from the content.
+
+    Returns:
+        pd.DataFrame: A DataFrame with columns "id" (the header up to the first
+        whitespace, as with SeqIO's record.id), "description" (the whole header
+        line without the leading ">"), and "sequence".
+    """
+    content = read_bytes(filepath_or_buffer)
+
+    # A record starts at each ">" found at the beginning of a line
+    starts = [0] if content.startswith(b">") else []
+    newline = content.find(b"\n>")
+    while newline >= 0:
+        starts.append(newline + 1)
+        newline = content.find(b"\n>", newline + 1)
+    record_ends = starts[1:] + [len(content)]
+    header_ends = [content.find(b"\n", start, end) for start, end in zip(starts, record_ends)]
+    header_ends = [header_end if header_end >= 0 else end for header_end, end in zip(header_ends, record_ends)]
+
+    descriptions = [content[start + 1:header_end].rstrip(b"\r").decode() \
+                    for start, header_end in zip(starts, header_ends)]
+    fasta_df = pd.DataFrame({"description": pd.Series(descriptions, dtype="O")})
+    fasta_df.insert(0, "id", fasta_df["description"].str.split(n=1).str[0])
+
+    if select is not None:
+        mask = np.asarray(select(fasta_df), dtype=bool)
+        fasta_df = fasta_df[mask].reset_index(drop=True)
+        header_ends = np.asarray(header_ends, dtype=np.int64)[mask].tolist()
+        record_ends = np.asarray(record_ends, dtype=np.int64)[mask].tolist()
+
+    # Nucleotides are replaced on the raw bytes with a lookup table in the same pass that drops the line breaks
+    table = U2T if replace_U2T else None
+    fasta_df["sequence"] = pd.Series([content[header_end + 1:end].translate(table, WHITESPACE).decode() \
+                                      for header_end, end in zip(header_ends, record_ends)], dtype="O")
+
+    return fasta_df
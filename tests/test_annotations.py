@@ -1,4 +1,16 @@
+import gzip
+import os
+import zipfile
+
+import networkx as nx
+import pandas as pd
+
 from openomics.database import RNAcentral, GTEx, GeneOntology
+import openomics
+from openomics.database.ontology import parse_obo, read_gaf
+from openomics.database.base import Annotatable, Database, extract_member, fuzzy_match_index
+from openomics.utils.df import to_arrow_strings
+from openomics.utils.io import extract_zip_member
 from .test_multiomics import *
 
 
@@ -79,3 +91,280 @@ def test_annotate_GeneOntology(generate_TCGA_LUAD, generate_GeneOntology):
                                                         columns=['go_id'])
     assert {'go_id'}.issubset(generate_TCGA_LUAD.MessengerRNA.annotations.columns)
     assert not generate_TCGA_LUAD.MessengerRNA.annotations["go_id"].empty
+
+
+def test_get_annotations_concat():
+    database = Database.__new__(Database)
+    database.data = pd.DataFrame({"gene_id": ["g1", "g1", "g1", "g2", "g3"],
+                                  "go_id": ["GO:1", "GO:2", "GO:1", None, "GO:3"],
+                                  "gene_name": ["A", "A", "A", "B", None]})
+
+    annotations = database.get_annotations("gene_id", columns=["go_id", "gene_name"])
+    assert annotations.loc["g1", "go_id"] == "GO:1|GO:2"
+    assert annotations.loc["g1", "gene_name"] == "A"
+    assert pd.isnull(annotations.loc["g2", "go_id"])
+    assert pd.isnull(annotations.loc["g3", "gene_name"])
+
+    filtered = database.get_annotations("gene_id", columns=["go_id"], filter_values=pd.Series(["g3"]))
+    assert filtered.index.tolist() == ["g3"]
+
+
+def test_get_annotations_cache():
+    database = Database.__new__(Database)
+    database.data = pd.DataFrame({"gene_id": ["g1", "g1", "g2"], "go_id": ["GO:1", "GO:2", "GO:3"]})
+
+    annotations = database.get_annotations("gene_id", columns=["go_id"])
+    assert len(database._annotations_cache) == 1
+    assert database.get_annotations("gene_id", columns=["go_id"]).equals(annotations)
+
+    for gene_list in (["g1"], ["g2"], ["g1", "g2"]):
+        filtered = database.get_annotations("gene_id", columns=["go_id"], filter_values=pd.Series(gene_list))
+        assert filtered.index.tolist() == gene_list
+    assert len(database._annotations_cache) == 1
+
+    as_list = database.get_annotations("gene_id", columns=["go_id"], as_list=True)
+    assert as_list.loc["g1", "go_id"] == ["GO:1", "GO:2"]
+
+    database.data = database.data[database.data["gene_id"] == "g2"]
+    assert database.get_annotations("gene_id", columns=["go_id"]).index.tolist() == ["g2"]
+
+
+def test_get_annotations_on_index():
+    database = Database.__new__(Database)
+    data = pd.DataFrame({"gene_id": ["g2", "g1", "g1"], "go_id": ["GO:3", "GO:1", "GO:2"]})
+    database.data = data.set_index("gene_id", drop=False).sort_index()
+
+    annotations = database.get_annotations("gene_id", columns=["gene_id", "go_id"], filter_values=["g1"])
+    assert annotations.index.tolist() == ["g1"]
+    assert annotations.loc["g1", "go_id"] == "GO:1|GO:2"
+
+
+def test_annotate_attributes_fills_existing_columns():
+    database = Database.__new__(Database)
+    database.data = pd.DataFrame({"gene_id": ["g1", "g2", "g3"], "gene_name": ["A", "B", "C"]})
+
+    annotatable = Annotatable()
+    annotatable.initialize_annotations(index="gene_id", gene_list=["g1", "g2", "g4"])
+    annotatable.annotations["gene_name"] = ["a", None, None]
+
+    annotatable.annotate_attributes(database, on="gene_id", columns=["gene_name"])
+    assert annotatable.annotations.columns.tolist() == ["gene_name"]
+    assert annotatable.annotations["gene_name"].tolist()[:2] == ["a", "B"]
+    assert pd.isnull(annotatable.annotations.loc["g4", "gene_name"])
+
+
+def test_annotate_attributes_on_column():
+    database = Database.__new__(Database)
+    database.data = pd.DataFrame({"gene_name": ["A", "A", "B"], "transcript_id": ["t1", "t2", "t3"]})
+
+    annotatable = Annotatable()
+    annotatable.initialize_annotations(index="gene_id", gene_list=["g1", "g2", "g3"])
+    annotatable.annotations["gene_name"] = ["A", "B", "C"]
+
+    annotatable.annotate_attributes(database, on="gene_name", columns=["transcript_id"])
+    assert annotatable.annotations.index.tolist() == ["g1", "g2", "g3"]
+    assert annotatable.annotations["transcript_id"].tolist()[:2] == ["t1|t2", "t3"]
+
+
+def test_to_arrow_strings():
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame({"gene_id": ["g1", "g2"], "go_id": ["GO:1", None], "terms": [["GO:1"], []]}) \
+        .set_index("gene_id", drop=False)
+
+    df = to_arrow_strings(df)
+    assert df["gene_id"].dtype == "string[pyarrow]"
+    assert df["go_id"].dtype == "string[pyarrow]"
+    assert df["terms"].dtype == object
+    assert df.index.dtype == "string[pyarrow]"
+
+
+def test_database_loads_data_lazily(tmp_path):
+    go_terms_file = tmp_path / "rnacentral_rfam_annotations.tsv"
+    go_terms_file.write_text("URS1_9606\tGO:1\tRF1\nURS1_9606\tGO:2\tRF1\n")
+    gene_ids_file = tmp_path / "gencode.tsv"
+    gene_ids_file.write_text("URS1\tGENCODE\tENST1\t9606\tlncRNA\tG1\n")
+
+    database = RNAcentral(path=str(tmp_path),
+                          file_resources={"rnacentral_rfam_annotations.tsv": str(go_terms_file),
+                                          "database_mappings/gencode.tsv": str(gene_ids_file)})
+    assert getattr(database, "_data", None) is None
+
+    assert database.data["go_id"].tolist() == ["GO:1|GO:2"]
+
+
+def test_get_predecessor_terms():
+    go = GeneOntology.__new__(GeneOntology)
+    go.network = nx.MultiDiGraph([("GO:3", "GO:2", "is_a"), ("GO:2", "GO:1", "is_a"), ("GO:4", "GO:1", "is_a")])
+
+    annotation = pd.Series([["GO:3"], None, ["GO:4", "GO:2"], []], index=["g1", "g1", "g2", "g3"])
+    parents = go.get_predecessor_terms(annotation)
+    assert parents.index.tolist() == ["g1", "g1", "g2", "g3"]
+    assert [sorted(terms) for terms in parents] == [["GO:1", "GO:2"], [], ["GO:1"], []]
+
+
+def test_fuzzy_match_index():
+    index = pd.Index(["TP53", "BRCA", "zzzzzz"], name="gene_name")
+    matched = fuzzy_match_index(index, pd.Index(["TP53X", "BRCA1", "EGFR"]))
+    assert matched.tolist() == ["TP53X", "BRCA1", "zzzzzz"]
+    assert matched.name == "gene_name"
+
+
+def test_extract_member(tmp_path):
+    archive = str(tmp_path / "table.tsv.zip")
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("data/table.tsv", "a\tb\n1\t2\n" * 1000)
+
+    for _ in range(2):
+        with zipfile.ZipFile(archive) as zf:
+            extracted = extract_member(zf, "table.tsv", archive)
+    assert extracted == str(tmp_path / "_extracted" / "data" / "table.tsv")
+    assert pd.read_table(extracted).shape == (1999, 2)
+
+    # A re-downloaded archive with a changed member is extracted again
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("data/table.tsv", "a\tb\n1\t2\n")
+    os.utime(archive, (os.path.getmtime(extracted) + 1,) * 2)
+    with zipfile.ZipFile(archive) as zf:
+        extracted = extract_member(zf, "table.tsv", archive)
+    assert pd.read_table(extracted).shape == (1, 2)
+
+
+def test_extract_zip_member_sanitizes_names(tmp_path):
+    archive = str(tmp_path / "table.zip")
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("../../escaped.tsv", "a\tb\n")
+
+    with zipfile.ZipFile(archive) as zf:
+        extracted = extract_zip_member(zf, zf.infolist()[0], str(tmp_path / "_extracted"))
+    assert extracted == str(tmp_path / "_extracted" / "escaped.tsv")
+    assert os.path.exists(extracted)
+
+
+def test_get_annotations_column_subset():
+    class ColumnsDatabase(Database):
+        LOADS_COLUMN_SUBSETS = True
+
+        def load_dataframe(self, file_resources, npartitions=None, columns=None):
+            self.loaded_columns = columns
+            df = pd.DataFrame({"gene": ["g1", "g1"], "term": ["a", "b"], "other": [1, 2]})
+            return df[columns] if columns is not None else df
+
+    database = ColumnsDatabase.__new__(ColumnsDatabase)
+    database.file_resources, database.npartitions, database._annotations_cache = {}, None, {}
+    database.col_rename = {"gene": "gene_name"}
+
+    annotations = database.get_annotations("gene_name", ["term"])
+    assert database.loaded_columns == ["gene", "term"]
+    assert annotations.loc["g1", "term"] == "a|b"
+    assert getattr(database, "_data", None) is None
+
+
+def test_get_annotations_numeric_agg():
+    database = Database.__new__(Database)
+    database.data = pd.DataFrame({"gene_id": ["g1", "g2", "g1", "g2", "g1"],
+                                  "tpm": [1.0, 4.0, None, 2.0, 3.0]})
+
+    for agg in ["sum", "mean", "min", "max", "median"]:
+        expected = database.data.groupby("gene_id", sort=False).agg({"tpm": agg})
+        pd.testing.assert_frame_equal(database.get_annotations("gene_id", columns=["tpm"], agg=agg), expected)
+
+
+def test_annotate_attributes_on_index_level():
+    database = Database.__new__(Database)
+    database.data = pd.DataFrame({"gene_name": ["A", "B", "C"], "transcript_id": ["t1", "t2", "t3"]})
+
+    annotatable = Annotatable()
+    annotatable.annotations = pd.DataFrame(
+        index=pd.MultiIndex.from_tuples([("g1", "A"), ("g2", "B"), ("g3", "A")], names=["gene_id", "gene_name"]))
+
+    annotatable.annotate_attributes(database, on="gene_name", columns=["transcript_id"])
+    assert annotatable.annotations.index.names == ["gene_id", "gene_name"]
+    assert annotatable.annotations["transcript_id"].tolist() == ["t1", "t2", "t1"]
+
+
+def test_set_index_keeps_index_levels():
+    annotatable = Annotatable()
+    annotatable.annotations = pd.DataFrame(
+        {"transcript_id": ["t1", None, "t3"]},
+        index=pd.MultiIndex.from_tuples([("g1", "A"), ("g2", "B"), ("g3", "A")], names=["gene_id", "gene_name"]))
+
+    annotatable.set_index("transcript_id")
+    assert annotatable.annotations.index.name == "transcript_id"
+    assert annotatable.annotations.columns.tolist() == ["gene_id", "gene_name"]
+    assert annotatable.annotations["gene_id"].tolist() == ["g1", "g2", "g3"]
+    assert annotatable.annotations["gene_name"].tolist() == ["A", "B", "A"]
+
+
+def test_parse_obo(tmp_path):
+    obo_file = tmp_path / "test.obo"
+    obo_file.write_text("format-version: 1.2\n\n"
+                        "[Term]\nid: GO:1\nname: child term\nnamespace: biological_process\n"
+                        "is_a: GO:2 ! parent term\nrelationship: part_of GO:3 ! other term\n\n"
+                        "[Term]\nid: GO:2\nname: parent term\nnamespace: biological_process\n\n"
+                        "[Term]\nid: GO:3\nname: other term\nnamespace: biological_process\n\n"
+                        "[Term]\nid: GO:4\nname: obsolete term\nis_obsolete: true\n\n"
+                        "[Typedef]\nid: part_of\nname: part of\n")
+
+    terms, edges = parse_obo(str(obo_file))
+    assert terms.index.tolist() == ["GO:1", "GO:2", "GO:3"]
+    assert terms.loc["GO:1", "name"] == "child term"
+    assert terms.loc["GO:1", "is_a"] == ["GO:2"]
+    assert edges.values.tolist() == [["GO:1", "is_a", "GO:2"], ["GO:1", "part_of", "GO:3"]]
+
+
+def test_go_annotations_cache(tmp_path, monkeypatch):
+    monkeypatch.setitem(openomics.config, "cache_dir", str(tmp_path / "cache"))
+    obo_file, gaf_file = tmp_path / "test.obo", tmp_path / "test.gaf"
+    obo_file.write_text("[Term]\nid: GO:1\nname: child term\nnamespace: molecular_function\nis_a: GO:2\n\n"
+                        "[Term]\nid: GO:2\nname: parent term\nnamespace: molecular_function\n")
+    gaf_file.write_text("UniProtKB\tP1\tGENE1\tenables\tGO:1\tPMID:1|PMID:2\tIEA\t\tF\tName\t\tprotein"
+                        "\ttaxon:9606\t20200101\tUniProt\t\t\n")
+
+    go = GeneOntology.__new__(GeneOntology)
+    go.go_terms, go.go_edges = parse_obo(str(obo_file))
+    file_resources = {"test.obo": str(obo_file), "test.gaf": str(gaf_file)}
+
+    parsed = go.load_dataframe(file_resources)
+    cached = go.load_dataframe(file_resources)
+    assert len(list((tmp_path / "cache" / "GeneOntology").iterdir())) == 1
+    assert cached["DB:Reference"].tolist() == parsed["DB:Reference"].tolist() == [["PMID:1", "PMID:2"]]
+    assert cached["is_a"].tolist() == [["GO:2"]]
+    assert cached["go_name"].tolist() == ["child term"]
+
+
+def test_go_get_annotations_gzip_handle(tmp_path, monkeypatch):
+    monkeypatch.setitem(openomics.config, "cache_dir", str(tmp_path / "cache"))
+    obo_file, gaf_file = tmp_path / "test.obo", tmp_path / "test.gaf.gz"
+    obo_file.write_text("[Term]\nid: GO:1\nname: child term\nnamespace: molecular_function\n")
+    with gzip.open(gaf_file, "wt") as file:
+        file.write("UniProtKB\tP1\tGENE1\tenables\tGO:1\tPMID:1\tIEA\t\tF\tName\t\tprotein"
+                   "\ttaxon:9606\t20200101\tUniProt\t\t\n")
+
+    for digest in [True, False]:
+        if not digest:
+            monkeypatch.setattr("openomics.database.ontology.file_resources_digest", lambda file_resources: None)
+
+        go = GeneOntology.__new__(GeneOntology)
+        go.go_terms, go.go_edges = parse_obo(str(obo_file))
+        go.file_resources = {"test.gaf": gzip.open(gaf_file, "rt")}
+        go.npartitions, go.col_rename, go._annotations_cache = None, GeneOntology.COLUMNS_RENAME_DICT, {}
+
+        # The handle is rewound, so that later loads don't read an exhausted file
+        assert go.get_annotations("gene_name", ["go_id"]).loc["GENE1", "go_id"] == "GO:1"
+        assert go.get_annotations("gene_name", ["go_name"]).loc["GENE1", "go_name"] == "child term"
+        assert go.data.shape[0] == 1
+
+
+def test_read_gaf(tmp_path):
+    gaf_file = tmp_path / "test.gaf"
+    gaf_file.write_text("!gaf-version: 2.2\n"
+                        "!generated-by: GOC\n"
+                        "UniProtKB\tP1\tGENE1\tenables\tGO:0003723\tGO_REF:1|PMID:2\tIEA\t\tF\tName\tSYN1|SYN2\tprotein"
+                        "\ttaxon:9606\t20200101\tUniProt\t\t\n")
+
+    gaf = read_gaf(str(gaf_file))
+    assert gaf.shape == (1, 17)
+    assert gaf.loc[0, "GO_ID"] == "GO:0003723"
+    assert gaf.loc[0, "DB:Reference"] == ["GO_REF:1", "PMID:2"]
+    assert gaf.loc[0, "Synonym"] == ["SYN1", "SYN2"]
+    assert gaf.loc[0, "With"] == [""]
@@ -1,6 +1,12 @@
+import gzip
+
 import dask.dataframe as dd
+import pandas as pd
 
 from openomics.database import GENCODE, MirBase
+from openomics.database.sequence import SequenceDatabase
+from openomics.utils.io import open_gzip
+from openomics.utils.read_fasta import parse_fasta
 from .test_multiomics import *
 
 
@@ -100,3 +106,87 @@ def test_annotate_sequence_GENCODE(generate_TCGA_LUAD, generate_GENCODE):
                                                  agg="longest")
 
     assert not generate_TCGA_LUAD.LncRNA.annotations["sequence"].empty
+
+
+def test_parse_fasta(tmp_path):
+    fasta_file = tmp_path / "test.fa"
+    fasta_file.write_text(">seq1|gene1 first record\r\nACGU\r\nACG\n>seq2|gene2\n\nUUAA\n>seq3\n")
+
+    fasta_df = parse_fasta(str(fasta_file), replace_U2T=True)
+    assert fasta_df["id"].tolist() == ["seq1|gene1", "seq2|gene2", "seq3"]
+    assert fasta_df["description"].tolist() == ["seq1|gene1 first record", "seq2|gene2", "seq3"]
+    assert fasta_df["sequence"].tolist() == ["ACGTACG", "TTAA", ""]
+
+
+def test_parse_fasta_gzip_handle(tmp_path):
+    fasta_file = tmp_path / "test.fa.gz"
+    with gzip.open(fasta_file, "wt") as file:
+        file.write(">seq1\nACGU\n>seq2\nGG\n")
+
+    with open_gzip(str(fasta_file)) as handle:
+        fasta_df = parse_fasta(handle)
+    assert fasta_df["sequence"].tolist() == ["ACGU", "GG"]
+
+
+def test_aggregate_sequences():
+    entries_df = pd.DataFrame({"gene_id": ["g1", "g1", "g1", "g2", "g2"],
+                               "sequence": ["AAA", "CC", "GGG", "T", "A"]})
+
+    longest = SequenceDatabase.aggregate_sequences(entries_df, "gene_id", "longest")
+    assert longest.to_dict() == {"g1": "AAA", "g2": "T"}
+
+    shortest = SequenceDatabase.aggregate_sequences(entries_df, "gene_id", "shortest")
+    assert shortest.to_dict() == {"g1": "CC", "g2": "T"}
+
+    all_seqs = SequenceDatabase.aggregate_sequences(entries_df, "gene_id", "all")
+    assert all_seqs.to_dict() == {"g1": ["AAA", "CC", "GGG"], "g2": ["T", "A"]}
+
+
+def test_mirbase_expand_aliases(tmp_path):
+    rnacentral_file = tmp_path / "mirbase.tsv"
+    rnacentral_file.write_text("URS1\tMIRBASE\tMI0000001\t9606\tpre_miRNA\t\n"
+                               "URS2\tMIRBASE\tMI0000002\t9606\tpre_miRNA\t\n"
+                               "URS3\tMIRBASE\tMI0000003\t10090\tpre_miRNA\t\n")
+    aliases_file = tmp_path / "aliases.txt"
+    aliases_file.write_text("MI0000001\thsa-let-7a;hsa-let-7a-1;\n"
+                            "MI0000002\thsa-mir-21;\n"
+                            "MI0000003\tmmu-mir-1;\n")
+
+    mirbase = MirBase.__new__(MirBase)
+    mirbase.species_id = 9606
+    aliases = mirbase.load_dataframe({"rnacentral.mirbase.tsv": str(rnacentral_file),
+                                      "aliases.txt": str(aliases_file)})
+
+    assert aliases.index.tolist() == ["MI0000001", "MI0000001", "MI0000002"]
+    assert aliases["gene_name"].tolist() == ["hsa-let-7a", "hsa-let-7a-1", "hsa-mir-21"]
+    assert aliases["RNAcentral id"].tolist() == ["URS1", "URS1", "URS2"]
+
+
+def test_mirbase_read_fasta(tmp_path):
+    fasta_file = tmp_path / "hairpin.fa"
+    fasta_file.write_text(">hsa-let-7a-1 MI0000060 Homo sapiens let-7a-1 stem-loop\nUGGGAUGAGG\nUAGUAGG\n"
+                          ">hsa-let-7a-2 MI0000061 Homo sapiens let-7a-2 stem-loop\nAGGUUGAGG\n")
+
+    mirbase = MirBase.__new__(MirBase)
+    entries_df = mirbase.read_fasta(str(fasta_file), replace_U2T=True)
+
+    assert entries_df["gene_name"].tolist() == ["hsa-let-7a-1", "hsa-let-7a-2"]
+    assert entries_df["mirbase id"].tolist() == ["MI0000060", "MI0000061"]
+    assert entries_df["species"].tolist() == ["Homo sapiens", "Homo sapiens"]
+    assert entries_df["sequence"].tolist() == ["TGGGATGAGGTAGTAGG", "AGGTTGAGG"]
+
+
+def test_gencode_read_fasta_keys(tmp_path):
+    fasta_file = tmp_path / "transcripts.fa"
+    fasta_file.write_text(
+        ">ENST01.1|ENSG01.2|-|-|T1-201|G1|6|lncRNA|\nACGUAC\n"
+        ">ENST02.1|ENSG02.1|-|-|T2-201|G2|4|lncRNA|\nGGCC\n"
+        ">ENST03.1|ENSG01.2|-|-|T1-202|G1|2|lncRNA|\nUU\n")
+
+    gencode = GENCODE.__new__(GENCODE)
+    gencode.remove_version_num = True
+    entries_df = gencode.read_fasta(str(fasta_file), replace_U2T=False, index="gene_id", keys={"ENSG01"})
+
+    assert entries_df["transcript_id"].tolist() == ["ENST01", "ENST03"]
+    assert entries_df["gene_name"].tolist() == ["G1", "G1"]
+    assert entries_df["sequence"].tolist() == ["ACGUAC", "UU"]